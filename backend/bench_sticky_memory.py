@@ -0,0 +1,70 @@
+"""
+Memory benchmark for StickyNote: bytes per note with the slotted, lazily
+allocated layout versus the previous plain-object layout.
+
+Usage:
+    python bench_sticky_memory.py [note_count] [fan_out]
+"""
+import gc
+import sys
+import tracemalloc
+import uuid
+
+from models import StickyNote
+
+
+class DictStickyNote:
+    """The previous layout: a per-instance __dict__ and an eager children dict."""
+
+    def __init__(self, title: str, description: str, note_id: str = None, parent: "DictStickyNote" = None):
+        self.id = note_id or uuid.uuid4().hex
+        self.title = title
+        self.description = description
+        self.parent = parent
+        self.children = {}
+
+    def add_child(self, title: str, description: str) -> "DictStickyNote":
+        child = DictStickyNote(title, description, parent=self)
+        self.children[title] = child
+        return child
+
+
+def build_tree(note_class, note_count: int, fan_out: int):
+    """Breadth-first tree with fan_out children per inner note."""
+    root = note_class("Root", "Top-level container", note_id="root")
+    frontier = [root]
+    created = 0
+    while created < note_count:
+        next_frontier = []
+        for parent in frontier:
+            for index in range(fan_out):
+                if created == note_count:
+                    break
+                next_frontier.append(parent.add_child(f"Note {created}", "Description"))
+                created += 1
+        frontier = next_frontier
+    return root
+
+
+def measure(note_class, note_count: int, fan_out: int) -> float:
+    """Bytes allocated per note while building the tree."""
+    gc.collect()
+    tracemalloc.start()
+    tree = build_tree(note_class, note_count, fan_out)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tree
+    return allocated / note_count
+
+
+if __name__ == "__main__":
+    note_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    fan_out = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    before = measure(DictStickyNote, note_count, fan_out)
+    after = measure(StickyNote, note_count, fan_out)
+
+    print(f"{note_count} notes, fan-out {fan_out}")
+    print(f"dict layout:    {before:8.1f} bytes/note")
+    print(f"slotted layout: {after:8.1f} bytes/note")
+    print(f"saved:          {before - after:8.1f} bytes/note ({(before - after) / before:.0%})")
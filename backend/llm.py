@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+from cachetools import TTLCache
+from starlette.concurrency import run_in_threadpool
+
+# Look for newer Gemini models first (1.5 flash, pro, etc.)
+PREFERRED_MODELS = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro"]
+FALLBACK_MODEL = "gemini-1.5-flash"
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of the resolved Gemini model.
+
+    Resolving a model means a `genai.list_models()` round trip, so it is done once
+    and shared by every HierarchicalDataManager. The handle is refreshed after
+    `ttl_seconds` or whenever a call reports a failure through `invalidate()`.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._model = None
+        self._api_key = None
+        self._resolved_at = 0.0
+
+    def _is_fresh(self, api_key: Optional[str]) -> bool:
+        return (
+            self._model is not None
+            and self._api_key == api_key
+            and time.monotonic() - self._resolved_at < self.ttl_seconds
+        )
+
+    def get_model(self, api_key: Optional[str]) -> "genai.GenerativeModel":
+        """
+        Get the shared model handle, resolving it on first use or when stale.
+
+        Args:
+            api_key: Your Google Gemini API key
+
+        Returns:
+            The shared GenerativeModel instance
+        """
+        if self._is_fresh(api_key):
+            return self._model
+
+        with self._lock:
+            # Another request may have refreshed the model while we waited
+            if self._is_fresh(api_key):
+                return self._model
+
+            genai.configure(api_key=api_key)
+            self._model = self._resolve_model()
+            self._api_key = api_key
+            self._resolved_at = time.monotonic()
+            return self._model
+
+    async def get_model_async(self, api_key: Optional[str]) -> "genai.GenerativeModel":
+        """
+        Same as get_model, but resolves a stale model off the event loop.
+
+        Args:
+            api_key: Your Google Gemini API key
+
+        Returns:
+            The shared GenerativeModel instance
+        """
+        if self._is_fresh(api_key):
+            return self._model
+        return await run_in_threadpool(self.get_model, api_key)
+
+    def invalidate(self):
+        """Drop the cached handle so the next request resolves the model again."""
+        with self._lock:
+            self._model = None
+
+    def _resolve_model(self) -> "genai.GenerativeModel":
+        model = None
+        try:
+            available_models = list(genai.list_models())
+
+            for preferred in PREFERRED_MODELS:
+                for candidate in available_models:
+                    if preferred in candidate.name and 'generateContent' in candidate.supported_generation_methods:
+                        model = genai.GenerativeModel(candidate.name)
+                        print(f"Using model: {candidate.name}")
+                        break
+                if model:
+                    break
+
+            # If no preferred models found, just use the first available text model
+            if not model:
+                for candidate in available_models:
+                    if 'generateContent' in candidate.supported_generation_methods:
+                        model = genai.GenerativeModel(candidate.name)
+                        print(f"Using available model: {candidate.name}")
+                        break
+        except Exception as e:
+            print(f"Error listing models: {str(e)}")
+
+        # Fallback to latest known model if we couldn't get or find any models
+        if model is None:
+            model = genai.GenerativeModel(FALLBACK_MODEL)
+            print(f"Using fallback model: {FALLBACK_MODEL}")
+
+        return model
+
+
+model_registry = ModelRegistry(ttl_seconds=float(os.getenv("GEMINI_MODEL_TTL_SECONDS", "3600")))
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of Gemini response text.
+
+    Entries are keyed by model name plus a hash of the whitespace-normalized prompt.
+    The in-memory tier is an LRU with a TTL. The optional SQLite tier at `db_path`
+    survives restarts and is shared by every worker pointed at the same file.
+    """
+
+    # How many disk writes between pruning expired and excess rows
+    PRUNE_EVERY = 100
+
+    def __init__(self, maxsize: int = 512, ttl_seconds: float = 3600,
+                 db_path: Optional[str] = None, max_disk_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._db = None
+        self.persistent = bool(db_path)
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, **config) -> str:
+        """
+        Build the cache key for a prompt.
+
+        Args:
+            model_name: Name of the model the prompt is sent to
+            prompt: The prompt text
+            **config: Extra generation arguments that change the output
+
+        Returns:
+            Hex digest identifying the request
+        """
+        normalized_prompt = " ".join(prompt.split())
+        fingerprint = json.dumps([model_name, normalized_prompt, config], sort_keys=True, default=str)
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look a response up in memory, then on disk."""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self.hits += 1
+                return text
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response FROM llm_cache WHERE key = ? AND created_at > ?",
+                    (key, time.time() - self.ttl_seconds)
+                ).fetchone()
+                if row:
+                    self._memory[key] = row[0]
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, text: str):
+        """Store a response in both tiers."""
+        with self._lock:
+            self._memory[key] = text
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, text, time.time())
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= self.PRUNE_EVERY:
+                    self._prune()
+                self._db.commit()
+
+    def _prune(self):
+        """Drop expired rows, then the oldest rows beyond max_disk_entries."""
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE key IN "
+            "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current sizes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            disk_entries = None
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "memoryEntries": len(self._memory),
+                "diskEntries": disk_entries
+            }
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+    db_path=os.getenv("LLM_CACHE_PATH") or None,
+    max_disk_entries=int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "10000"))
+)
+
+# Upper bound on Gemini calls in flight across all requests in this worker
+llm_concurrency_limit = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+
+async def generate_content_async(model: "genai.GenerativeModel", prompt: str, **kwargs):
+    """
+    Call Gemini through its native async client without blocking the event loop.
+
+    Args:
+        model: The model to call
+        prompt: The prompt to send
+        **kwargs: Extra arguments for generate_content_async
+
+    Returns:
+        The raw Gemini response
+    """
+    async with llm_concurrency_limit:
+        try:
+            return await model.generate_content_async(prompt, **kwargs)
+        except Exception:
+            model_registry.invalidate()
+            raise
+
+
+def response_text(response) -> str:
+    """Pull the text out of a Gemini response."""
+    try:
+        return response.text
+    except AttributeError:
+        # Alternative approach if the API has changed
+        return response.candidates[0].content.parts[0].text
+
+
+async def generate_text_async(model: "genai.GenerativeModel", prompt: str, use_cache: bool = False, **kwargs) -> str:
+    """
+    Call Gemini and return the response text, going through the response cache if asked.
+
+    Args:
+        model: The model to call
+        prompt: The prompt to send
+        use_cache: Whether to serve and store this prompt in the response cache
+        **kwargs: Extra arguments for generate_content_async
+
+    Returns:
+        The response text
+    """
+    if not use_cache:
+        return response_text(await generate_content_async(model, prompt, **kwargs))
+
+    model_name = getattr(model, "model_name", type(model).__name__)
+    key = response_cache.make_key(model_name, prompt, **kwargs)
+
+    # The disk tier is a blocking sqlite call, keep it off the event loop
+    if response_cache.persistent:
+        text = await run_in_threadpool(response_cache.get, key)
+    else:
+        text = response_cache.get(key)
+    if text is not None:
+        return text
+
+    text = response_text(await generate_content_async(model, prompt, **kwargs))
+    if response_cache.persistent:
+        await run_in_threadpool(response_cache.set, key, text)
+    else:
+        response_cache.set(key, text)
+    return text
+
+
+async def stream_text_async(model: "genai.GenerativeModel", prompt: str, use_cache: bool = False, **kwargs):
+    """
+    Stream the response text from Gemini chunk by chunk.
+
+    A cached response is yielded as a single chunk; a completed stream is stored
+    in the cache so the non-streaming path can reuse it.
+
+    Args:
+        model: The model to call
+        prompt: The prompt to send
+        use_cache: Whether to serve and store this prompt in the response cache
+        **kwargs: Extra arguments for generate_content_async
+
+    Yields:
+        Pieces of the response text as they arrive
+    """
+    key = None
+    if use_cache:
+        model_name = getattr(model, "model_name", type(model).__name__)
+        key = response_cache.make_key(model_name, prompt, **kwargs)
+        if response_cache.persistent:
+            text = await run_in_threadpool(response_cache.get, key)
+        else:
+            text = response_cache.get(key)
+        if text is not None:
+            yield text
+            return
+
+    pieces = []
+    try:
+        async with llm_concurrency_limit:
+            response = await model.generate_content_async(prompt, stream=True, **kwargs)
+        chunks = response.__aiter__()
+        while True:
+            # Hold a permit only while pulling from Gemini, so a slow consumer cannot keep one
+            async with llm_concurrency_limit:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+            text = response_text(chunk)
+            if text:
+                pieces.append(text)
+                yield text
+    except Exception:
+        model_registry.invalidate()
+        raise
+
+    if key is not None:
+        if response_cache.persistent:
+            await run_in_threadpool(response_cache.set, key, "".join(pieces))
+        else:
+            response_cache.set(key, "".join(pieces))
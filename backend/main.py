@@ -1,60 +1,113 @@
+import anyio
+import asyncio
 import json
 import google.generativeai as genai
 import os
 import re
 import uuid
+from difflib import SequenceMatcher
+from collections import Counter, OrderedDict, deque
+from functools import partial
 from typing import Dict, List, Any, Tuple, Union
 from dotenv import load_dotenv
+from llm import model_registry, response_cache, generate_content_async, generate_text_async, stream_text_async
+from storage import ID_COUNTERS_KEY, KnowledgeBaseJournal, SqliteCanvasStore, SqliteStickyNoteTree
 
 # Add this to the imports section at the top of the file
-from pydantic import BaseModel, Field
-from typing import Dict, List, Any, Optional, Union, Set
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Any, Optional, Union, Set, Callable
 
 load_dotenv()
 
+# Response schemas for structured (JSON) extraction, validated with Pydantic
+class ExtractedEntity(BaseModel):
+    title: str
+    description: str
+    sector: str
+
+class EntityExtraction(BaseModel):
+    entities: List[ExtractedEntity]
+
+class NoteEntityExtraction(BaseModel):
+    noteId: str
+    entities: List[ExtractedEntity]
+
+class BatchEntityExtraction(BaseModel):
+    notes: List[NoteEntityExtraction]
+
+class KeyPoint(BaseModel):
+    title: str
+    description: str
+
+class KeyPointExtraction(BaseModel):
+    points: List[KeyPoint]
+
+class RemovalTarget(BaseModel):
+    item: str
+    type: str
+
+# How often extraction parsed cleanly vs. needed a fallback, served at /api/extraction-metrics
+extraction_metrics = Counter()
+
+class EntityStreamParser:
+    """
+    Line-oriented parser for the "Entities:" format that works on a streamed completion.
+    
+    feed() returns the entities whose "- Title: ... | Description: ... | Sector: ..."
+    line was completed by the chunk, so notes can be created before the model finishes.
+    """
+    
+    ENTITY_LINE = re.compile(r"^-\s*Title:\s*(.*?)\s*\|\s*Description:\s*(.*?)\s*\|\s*Sector:\s*(.*?)\s*$")
+    
+    def __init__(self):
+        self._buffer = ""
+        self._in_entities = False
+    
+    def feed(self, text: str) -> List[Tuple[str, str, str]]:
+        """
+        Consume the next chunk of the completion.
+        
+        Args:
+            text: The chunk text
+            
+        Returns:
+            List of (title, description, sector) tuples completed by this chunk
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        return [entity for entity in map(self._parse_line, lines) if entity]
+    
+    def close(self) -> List[Tuple[str, str, str]]:
+        """Parse whatever is left after the stream ends."""
+        line, self._buffer = self._buffer, ""
+        entity = self._parse_line(line)
+        return [entity] if entity else []
+    
+    def _parse_line(self, line: str) -> Optional[Tuple[str, str, str]]:
+        line = line.strip()
+        if line.startswith("Entities:"):
+            self._in_entities = True
+            line = line[len("Entities:"):].strip()
+        if not self._in_entities:
+            return None
+        
+        match = self.ENTITY_LINE.match(line)
+        return match.groups() if match else None
+
 class HierarchicalDataManager:
-    def __init__(self, gemini_api_key: str, initial_knowledge_base: Dict[str, Any] = None):
+    def __init__(self, gemini_api_key: str, initial_knowledge_base: Dict[str, Any] = None,
+                 model: "genai.GenerativeModel" = None):
         """
         Initialize the Hierarchical Data Manager with Gemini API integration.
         
         Args:
             gemini_api_key: Your Google Gemini API key
             initial_knowledge_base: Optional custom knowledge base to start with
+            model: The resolved model; async callers pass model_registry.get_model_async()'s
+                result so a stale handle is never resolved on the event loop
         """
-        genai.configure(api_key=gemini_api_key)
-        
-        # Updated model selection logic - trying newer models first
-        try:
-            # First try to list available models
-            available_models = genai.list_models()
-            self.model = None
-            
-            # Look for newer Gemini models first (1.5 flash, pro, etc.)
-            preferred_models = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-pro"]
-            
-            for preferred in preferred_models:
-                for model in available_models:
-                    if preferred in model.name and 'generateContent' in model.supported_generation_methods:
-                        self.model = genai.GenerativeModel(model.name)
-                        print(f"Using model: {model.name}")
-                        break
-                if self.model:
-                    break
-            
-            # If no preferred models found, just use the first available text model
-            if not self.model:
-                for model in available_models:
-                    if 'generateContent' in model.supported_generation_methods:
-                        self.model = genai.GenerativeModel(model.name)
-                        print(f"Using available model: {model.name}")
-                        break
-        except Exception as e:
-            print(f"Error listing models: {str(e)}")
-            
-        # Fallback to latest known model if we couldn't get or find any models
-        if self.model is None:
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("Using fallback model: gemini-1.5-flash")
+        # Resolving the model costs a list_models() round trip, so reuse the shared handle
+        self.model = model if model is not None else model_registry.get_model(gemini_api_key)
         
         # Set default colors for sectors
         self.sector_colors = {
@@ -68,36 +121,126 @@ class HierarchicalDataManager:
             "music": "bg-purple-200"  # Added based on second file
         }
         
+        # Work on cp-1 unless switched, see switch_checkpoint
+        self.current_checkpoint = "cp-1"
+        
+        # Lookup indexes over the current checkpoint (ID, title, selection), kept in sync by
+        # every mutation. None until the first lookup after a switch, see _indexes
+        self._current_indexes: Optional[Tuple[Dict, Dict, Dict]] = None
+        
+        # Indexes of recently left checkpoints, least recently used first, so switching back is O(1)
+        self._checkpoint_indexes: "OrderedDict[str, Tuple[Dict, Dict, Dict]]" = OrderedDict()
+        self.checkpoint_index_limit = int(os.getenv("CHECKPOINT_INDEX_LIMIT", "4"))
+        
+        # Highest ID suffix per prefix over every note ever present, computed once, see _allocate_note_id
+        self._id_seeds: Optional[Dict[str, int]] = None
+        
+        # Child lists and notes each checkpoint may mutate in place, by id(). Checkpoints
+        # without an entry share nothing; see create_checkpoint
+        self._owned: Dict[str, Tuple[Set[int], Set[int]]] = {}
+        
+        # Mutations since the last take_changes() call
+        self._changes = self._empty_changes()
+        
+        # Write-ahead journal every mutation is appended to, see open_journal
+        self.journal: Optional[KnowledgeBaseJournal] = None
+        
         # Initialize with the custom knowledge base if provided, otherwise use default structure
         if initial_knowledge_base:
             self.knowledge_base = initial_knowledge_base
+            self._rebuild_index()
         else:
             # Initialize with new format matching the second file
-            self.knowledge_base = {
-                "cp-1": {
-                    "root": [
-                        self._create_note("Inventory", "Track and manage your inventory levels, suppliers, and procurement processes.", 100, 100, "inventory"),
-                        self._create_note("Manufacturing", "Monitor production processes, quality control, and operational efficiency.", 400, 100, "manufacturing"),
-                        self._create_note("Product Strategy", "Plan product roadmaps, feature development, and market positioning.", 100, 350, "product"),
-                        self._create_note("Human Operations", "Manage recruitment, training, performance, and employee engagement.", 400, 350, "human")
-                    ]
-                }
-            }
+            self.knowledge_base = {"cp-1": {"root": []}}
+            for title, content, x, y, sector in [
+                ("Inventory", "Track and manage your inventory levels, suppliers, and procurement processes.", 100, 100, "inventory"),
+                ("Manufacturing", "Monitor production processes, quality control, and operational efficiency.", 400, 100, "manufacturing"),
+                ("Product Strategy", "Plan product roadmaps, feature development, and market positioning.", 100, 350, "product"),
+                ("Human Operations", "Manage recruitment, training, performance, and employee engagement.", 400, 350, "human")
+            ]:
+                self._add_note("root", self._create_note(title, content, x, y, sector))
             
             # Add children to Inventory as an example
             inventory_id = self.knowledge_base["cp-1"]["root"][0]["id"]
-            self.knowledge_base["cp-1"][inventory_id] = [
-                self._create_note("Suppliers", "List of key suppliers and contact information.", 100, 100, "inventory", inventory_id),
-                self._create_note("Stock Levels", "Current inventory levels and reorder points.", 400, 100, "inventory", inventory_id)
-            ]
+            self._add_note(inventory_id, self._create_note("Suppliers", "List of key suppliers and contact information.", 100, 100, "inventory", inventory_id))
+            self._add_note(inventory_id, self._create_note("Stock Levels", "Current inventory levels and reorder points.", 400, 100, "inventory", inventory_id))
+            
+            # The default notes are the starting state, not pending changes
+            self.take_changes()
         
-        # Track the latest checkpoint - but only consider cp-1 as requested
-        self.current_checkpoint = "cp-1"
+        # How process_information fans out over the selected notes
+        self.processing_mode = os.getenv("NOTE_PROCESSING_MODE", "parallel")
+        self.max_parallel_notes = int(os.getenv("NOTE_FANOUT_LIMIT", "4"))
+        self.note_timeout = float(os.getenv("NOTE_TIMEOUT_SECONDS", "60"))
+        
+        # "json" asks Gemini for schema-constrained output, "text" uses the regex-parsed formats
+        self.extraction_mode = os.getenv("ENTITY_EXTRACTION_MODE", "json")
+        
+        # Rough token budget for canvas context pasted into feedback prompts
+        self.prompt_context_tokens = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1500"))
+    
+    async def _generate(self, prompt: str):
+        """
+        Call the shared Gemini model without blocking the event loop.
+        
+        Args:
+            prompt: The prompt to send
+            
+        Returns:
+            The raw Gemini response
+        """
+        return await generate_content_async(self.model, prompt)
+    
+    async def _generate_text(self, prompt: str, cached: bool = False, **kwargs) -> str:
+        """
+        Call the shared Gemini model and return the response text.
+        
+        Args:
+            prompt: The prompt to send
+            cached: Whether an identical earlier prompt may be answered from the response cache
+            **kwargs: Extra arguments for generate_content_async (e.g. generation_config)
+            
+        Returns:
+            The response text
+        """
+        return await generate_text_async(self.model, prompt, use_cache=cached, **kwargs)
+    
+    async def _generate_structured(self, prompt: str, schema: type) -> Optional[BaseModel]:
+        """
+        Ask Gemini for JSON output constrained to a Pydantic schema and validate it.
+        
+        Args:
+            prompt: The prompt to send
+            schema: The Pydantic model describing the expected output
+            
+        Returns:
+            The validated model, or None if the response was empty or invalid
+        """
+        generation_config = {"response_mime_type": "application/json", "response_schema": schema}
+        
+        try:
+            text = await self._generate_text(prompt, cached=True, generation_config=generation_config)
+        except (AttributeError, IndexError):
+            extraction_metrics["json_empty"] += 1
+            return None
+        
+        try:
+            parsed = schema.model_validate_json(text)
+        except ValidationError as e:
+            print(f"Invalid structured output for {schema.__name__}: {str(e)}")
+            extraction_metrics["json_invalid"] += 1
+            return None
+        
+        extraction_metrics["json_parsed"] += 1
+        return parsed
     
     def _get_latest_checkpoint(self) -> str:
         """Get the latest checkpoint ID from the knowledge base"""
-        # As per requirement, we only consider cp-1
-        return "cp-1"
+        numbered = [
+            (int(match.group(1)), checkpoint) for checkpoint in self.knowledge_base
+            if (match := re.match(r"^cp-(\d+)$", checkpoint))
+        ]
+        return max(numbered)[1] if numbered else self.current_checkpoint
     
     def _create_note(self, title: str, content: str, x: int, y: int, sector: str, 
                      parent_id: str = None, selected: bool = False) -> Dict[str, Any]:
@@ -116,15 +259,8 @@ class HierarchicalDataManager:
         Returns:
             Dict representing the note
         """
-        # Generate unique ID based on parent and title
-        if parent_id:
-            # Count existing siblings to determine index
-            siblings = self._get_children_of_note(parent_id)
-            note_id = f"{parent_id}-{len(siblings) + 1}"
-        else:
-            # For root level notes
-            root_notes = self.knowledge_base.get(self.current_checkpoint, {}).get("root", [])
-            note_id = f"note-{len(root_notes) + 1}"
+        # Generate unique ID based on parent
+        note_id = self._allocate_note_id(parent_id)
         
         # Get color based on sector
         color = self.sector_colors.get(sector, "bg-gray-200")
@@ -143,24 +279,486 @@ class HierarchicalDataManager:
             "zIndex": 1
         }
     
+    @property
+    def _id_counters(self) -> Dict[str, int]:
+        """High-water mark per ID prefix, kept in the knowledge base so it is saved and sent along with it."""
+        return self.knowledge_base.setdefault(ID_COUNTERS_KEY, {})
+    
+    def _checkpoints(self):
+        """(name, data) for every checkpoint, skipping the ID counters stored beside them."""
+        return ((name, data) for name, data in self.knowledge_base.items() if name != ID_COUNTERS_KEY)
+    
+    def _has_checkpoint(self, checkpoint: str) -> bool:
+        return checkpoint != ID_COUNTERS_KEY and checkpoint in self.knowledge_base
+    
+    def _allocate_note_id(self, parent_id: str = None) -> str:
+        """
+        Allocate the next free ID under a parent ('note-N' at root, '<parent>-N' below).
+        
+        One high-water mark per prefix is shared by every checkpoint and stored in the
+        knowledge base (and journaled), so an ID is never handed out twice: not after a
+        removal, not across a save/load or replay, and not in two checkpoints branched
+        from the same one. Knowledge bases saved without marks are seeded from the
+        highest suffix present in any checkpoint.
+        
+        Args:
+            parent_id: ID of the parent note (None for root level)
+            
+        Returns:
+            The new note ID
+        """
+        counters = self._id_counters
+        prefix = parent_id or "note"
+        
+        if self._id_seeds is None:
+            self._id_seeds = {}
+            for _, data in self._checkpoints():
+                for notes in data.values():
+                    for note in notes:
+                        match = re.match(r"^(.+)-(\d+)$", str(note["id"]))
+                        if match and int(match.group(2)) > self._id_seeds.get(match.group(1), 0):
+                            self._id_seeds[match.group(1)] = int(match.group(2))
+        
+        # Skip IDs that clients already used under other parents
+        next_index = max(counters.get(prefix, 0), self._id_seeds.get(prefix, 0)) + 1
+        while f"{prefix}-{next_index}" in self._note_index:
+            next_index += 1
+        
+        counters[prefix] = next_index
+        self._changes["idCounters"][prefix] = next_index
+        if self.journal is not None:
+            self.journal.append({"op": "ids", "prefix": prefix, "value": next_index})
+        return f"{prefix}-{next_index}"
+    
     def _get_children_of_note(self, note_id: str) -> List[Dict[str, Any]]:
         """Get children notes of a specific note"""
         return self.knowledge_base.get(self.current_checkpoint, {}).get(note_id, [])
     
-    def create_checkpoint(self) -> Dict[str, Any]:
+    def _indexes(self) -> Tuple[Dict, Dict, Dict]:
+        """The current checkpoint's indexes, built on first use."""
+        if self._current_indexes is None:
+            self._rebuild_index()
+        return self._current_indexes
+    
+    @property
+    def _note_index(self) -> Dict[str, Tuple[Dict[str, Any], str]]:
+        return self._indexes()[0]
+    
+    @property
+    def _title_index(self) -> Dict[str, List[Tuple[Dict[str, Any], str]]]:
+        return self._indexes()[1]
+    
+    @property
+    def _selected_ids(self) -> Dict[str, Dict[str, Any]]:
+        return self._indexes()[2]
+    
+    def _rebuild_index(self):
+        """Rebuild the ID, title and selection indexes from the current checkpoint."""
+        self._current_indexes = ({}, {}, {})
+        
+        for parent_id, notes in self.knowledge_base.get(self.current_checkpoint, {}).items():
+            for note in notes:
+                self._index_note(note, parent_id)
+    
+    def _index_note(self, note: Dict[str, Any], parent_id: str):
+        """Add a note to the lookup indexes."""
+        # Keep the first occurrence on duplicate IDs, like a scan would
+        self._note_index.setdefault(note["id"], (note, parent_id))
+        # Title lists are replaced rather than appended to, checkpoints may share them
+        title_key = note["title"].lower()
+        self._title_index[title_key] = self._title_index.get(title_key, []) + [(note, parent_id)]
+        if note.get("selected", False):
+            self._selected_ids.setdefault(note["id"], note)
+    
+    def _unindex_note(self, note: Dict[str, Any]):
+        """Remove a note from the lookup indexes."""
+        if self._note_index.get(note["id"], (None,))[0] is note:
+            del self._note_index[note["id"]]
+        
+        title_key = note["title"].lower()
+        entries = [entry for entry in self._title_index.get(title_key, []) if entry[0] is not note]
+        if entries:
+            self._title_index[title_key] = entries
+        else:
+            self._title_index.pop(title_key, None)
+        
+        if self._selected_ids.get(note["id"]) is note:
+            del self._selected_ids[note["id"]]
+    
+    def _add_note(self, parent_id: str, note: Dict[str, Any]):
+        """
+        Append a note to its parent's child list and index it.
+        
+        Args:
+            parent_id: The parent note ID, or 'root'
+            note: The note to add
+        """
+        self._writable_children(parent_id).append(note)
+        self._mark_owned(note=note)
+        self._index_note(note, parent_id)
+        self._record_change("add", note, parent_id)
+    
+    def _update_note(self, note: Dict[str, Any], **fields) -> Dict[str, Any]:
+        """
+        Update fields on a note, keeping the indexes in sync.
+        
+        Args:
+            note: The note to update
+            **fields: The fields to set
+            
+        Returns:
+            The updated note, which is a copy of `note` if it was shared with another checkpoint
+        """
+        fields = {key: value for key, value in fields.items() if note.get(key) != value}
+        if not fields:
+            return note
+        
+        entry = self._note_index.get(note["id"])
+        parent_id = entry[1] if entry else note.get("parentId") or "root"
+        note = self._writable_note(note, parent_id)
+        self._record_change("update", note, parent_id, fields)
+        
+        if "title" not in fields and "selected" not in fields:
+            note.update(fields)
+            return note
+        
+        self._unindex_note(note)
+        note.update(fields)
+        self._index_note(note, parent_id)
+        return note
+    
+    def _mark_owned(self, children: List[Dict[str, Any]] = None, note: Dict[str, Any] = None):
+        """Record that the current checkpoint created a child list or note, so it may change it in place."""
+        owned = self._owned.get(self.current_checkpoint)
+        if owned is None:
+            return
+        if children is not None:
+            owned[0].add(id(children))
+        if note is not None:
+            owned[1].add(id(note))
+    
+    def _writable_children(self, parent_id: str) -> List[Dict[str, Any]]:
+        """
+        Get a parent's child list for mutation, copying it first if another checkpoint shares it.
+        
+        Args:
+            parent_id: The parent note ID, or 'root'
+            
+        Returns:
+            A child list owned by the current checkpoint
+        """
+        checkpoint = self.knowledge_base[self.current_checkpoint]
+        children = checkpoint.get(parent_id)
+        owned = self._owned.get(self.current_checkpoint)
+        
+        if children is None:
+            children = checkpoint[parent_id] = []
+        elif owned is not None and id(children) not in owned[0]:
+            children = checkpoint[parent_id] = list(children)
+        else:
+            return children
+        
+        self._mark_owned(children=children)
+        return children
+    
+    def _writable_note(self, note: Dict[str, Any], parent_id: str) -> Dict[str, Any]:
+        """
+        Get a note for mutation, copying it first if another checkpoint shares it.
+        
+        The copy takes the original's place in the child list, the indexes and the
+        pending change set, so callers just carry on with the returned note.
+        
+        Args:
+            note: The note to update
+            parent_id: The note's parent ID, or 'root'
+            
+        Returns:
+            A note owned by the current checkpoint
+        """
+        owned = self._owned.get(self.current_checkpoint)
+        if owned is None or id(note) in owned[1]:
+            return note
+        
+        clone = dict(note)
+        for key, value in clone.items():
+            # position and files are the only nested values, but copy whatever is there
+            if isinstance(value, (dict, list)):
+                clone[key] = type(value)(value)
+        self._mark_owned(note=clone)
+        
+        siblings = self._writable_children(parent_id)
+        for position, sibling in enumerate(siblings):
+            if sibling is note:
+                siblings[position] = clone
+                break
+        
+        note_id = note["id"]
+        if self._note_index.get(note_id, (None,))[0] is note:
+            self._note_index[note_id] = (clone, parent_id)
+        title_key = note["title"].lower()
+        self._title_index[title_key] = [
+            (clone if entry_note is note else entry_note, entry_parent)
+            for entry_note, entry_parent in self._title_index.get(title_key, [])
+        ]
+        if self._selected_ids.get(note_id) is note:
+            self._selected_ids[note_id] = clone
+        
+        added = self._changes["added"].get((self.current_checkpoint, note_id))
+        if added is not None and added[1] is note:
+            self._changes["added"][(self.current_checkpoint, note_id)] = (added[0], clone)
+        
+        return clone
+    
+    def _record_change(self, op: str, note: Dict[str, Any], parent_id: str, fields: Dict[str, Any] = None):
+        """
+        Record a mutation in the pending change set returned by take_changes().
+        
+        Args:
+            op: "add", "update", "move" or "remove"
+            note: The affected note
+            parent_id: The note's parent ID, or 'root' (the new one for "move")
+            fields: The updated fields (for "update")
+        """
+        if self.journal is not None:
+            record = {"op": op, "checkpoint": self.current_checkpoint, "id": note["id"]}
+            if op == "add":
+                record.update(parentId=parent_id, note=note)
+            elif op == "update":
+                record["fields"] = fields
+            elif op in ("move", "remove"):
+                record["parentId"] = parent_id
+            self.journal.append(record)
+        
+        changes = self._changes
+        # The same note ID lives in every checkpoint branched after it was created
+        key = (self.current_checkpoint, note["id"])
+        
+        if op == "add":
+            changes["removed"].pop(key, None)
+            changes["added"][key] = (parent_id, note)
+        elif op == "update":
+            if key in changes["added"]:
+                # The added entry references the note itself, so it already carries the new fields
+                return
+            changes["updated"].setdefault(key, {}).update(fields)
+        elif op == "move":
+            if key in changes["added"]:
+                # Not on the client yet, so just add it under the new parent
+                changes["added"][key] = (parent_id, note)
+                return
+            changes["moved"][key] = parent_id
+        elif op == "remove":
+            changes["updated"].pop(key, None)
+            changes["moved"].pop(key, None)
+            if changes["added"].pop(key, None) is None:
+                # One entry per copy, so stores can tell copies of a duplicated ID apart
+                changes["removed"].setdefault(key, []).append(parent_id)
+    
+    @staticmethod
+    def _empty_changes() -> Dict[str, Any]:
+        return {"checkpoints": {}, "added": {}, "updated": {}, "moved": {}, "removed": {}, "idCounters": {},
+                "currentCheckpoint": None}
+    
+    def take_changes(self) -> Dict[str, Any]:
+        """
+        Get the changes made since the last call, as a patch, and start a new change set.
+        
+        Returns:
+            Dict with "checkpoints" ({checkpoint, from}: copy an existing checkpoint, applied
+            first), "added" ({checkpoint, parentId, note}), "updated" ({checkpoint, id, fields}),
+            "moved" ({checkpoint, id, parentId}: relink the note and its subtree under a new
+            parent) and "removed" ({checkpoint, id, parentId}) lists, plus "idCounters" (the ID high-water
+            marks that moved, see _allocate_note_id) and "currentCheckpoint" (the checkpoint
+            switched to, or None if the current one did not change)
+        """
+        changes = self._changes
+        self._changes = self._empty_changes()
+        
+        # Between operations is the only point where the knowledge base is consistent enough to snapshot
+        if self.journal is not None and self.journal.needs_compaction:
+            self.journal.compact(self.knowledge_base)
+        
+        return {
+            "checkpoints": [
+                {"checkpoint": checkpoint, "from": source}
+                for checkpoint, source in changes["checkpoints"].items()
+            ],
+            "added": [
+                {"checkpoint": checkpoint, "parentId": parent_id, "note": dict(note)}
+                for (checkpoint, _), (parent_id, note) in changes["added"].items()
+            ],
+            "updated": [
+                {"checkpoint": checkpoint, "id": note_id, "fields": fields}
+                for (checkpoint, note_id), fields in changes["updated"].items()
+            ],
+            "moved": [
+                {"checkpoint": checkpoint, "id": note_id, "parentId": parent_id}
+                for (checkpoint, note_id), parent_id in changes["moved"].items()
+            ],
+            "removed": [
+                {"checkpoint": checkpoint, "id": note_id, "parentId": parent_id}
+                for (checkpoint, note_id), parent_ids in changes["removed"].items()
+                for parent_id in parent_ids
+            ],
+            "idCounters": changes["idCounters"],
+            "currentCheckpoint": changes["currentCheckpoint"]
+        }
+    
+    def _find_child_by_title(self, parent_id: str, title: str) -> Optional[Dict[str, Any]]:
+        """Find a direct child of parent_id by case-insensitive title."""
+        for note, note_parent_id in self._title_index.get(title.lower(), []):
+            if note_parent_id == parent_id:
+                return note
+        return None
+    
+    def create_checkpoint(self, source: str = None) -> Dict[str, Any]:
         """
-        Create a new checkpoint based on the current state.
-        Note: As per requirement, only cp-1 is considered
+        Create a new checkpoint as a snapshot of an existing one and switch to it.
         
+        The snapshot shares every child list and note with its source. Both sides
+        copy a list or note the first time they change it (see _writable_children
+        and _writable_note), so a checkpoint costs memory only for what differs.
+        Its lookup indexes are not copied either; they are built on first use.
+        Take pending changes first so a patch's "checkpoints" entry branches from
+        the state the client already has.
+        
+        Args:
+            source: Checkpoint to copy (defaults to the current one)
+            
         Returns:
             Dict containing the result of the operation
         """
-        # We're only considering cp-1, so just return a message
+        source = source or self.current_checkpoint
+        if not self._has_checkpoint(source):
+            return {
+                "success": False,
+                "message": f"Checkpoint '{source}' does not exist."
+            }
+        
+        latest = re.match(r"^cp-(\d+)$", self._get_latest_checkpoint())
+        checkpoint = f"cp-{int(latest.group(1)) + 1 if latest else len(self.knowledge_base) + 1}"
+        
+        self.knowledge_base[checkpoint] = dict(self.knowledge_base[source])
+        # Everything the source owned is now shared, so neither side may change it in place
+        self._owned[source] = (set(), set())
+        self._owned[checkpoint] = (set(), set())
+        
+        self._changes["checkpoints"][checkpoint] = source
+        if self.journal is not None:
+            self.journal.append({"op": "checkpoint", "checkpoint": checkpoint, "from": source})
+        self.switch_checkpoint(checkpoint)
+        
         return {
-            "success": False,
-            "message": "Only cp-1 is considered in this version"
+            "success": True,
+            "message": f"Created checkpoint '{checkpoint}' from '{source}'",
+            "checkpoint": checkpoint
         }
     
+    def switch_checkpoint(self, checkpoint: str) -> Dict[str, Any]:
+        """
+        Make another checkpoint the one lookups and edits apply to.
+        
+        Args:
+            checkpoint: The checkpoint ID
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        if not self._has_checkpoint(checkpoint):
+            return {
+                "success": False,
+                "message": f"Checkpoint '{checkpoint}' does not exist."
+            }
+        
+        if checkpoint != self.current_checkpoint:
+            if self._current_indexes is not None:
+                # Keep a few checkpoints' indexes, not one full set per checkpoint ever visited
+                self._checkpoint_indexes[self.current_checkpoint] = self._current_indexes
+                while len(self._checkpoint_indexes) > self.checkpoint_index_limit:
+                    self._checkpoint_indexes.popitem(last=False)
+            self.current_checkpoint = checkpoint
+            # Built on the first lookup if not kept
+            self._current_indexes = self._checkpoint_indexes.pop(checkpoint, None)
+            self._changes["currentCheckpoint"] = checkpoint
+            if self.journal is not None:
+                self.journal.set_meta(currentCheckpoint=checkpoint)
+        
+        return {
+            "success": True,
+            "message": f"Switched to checkpoint '{checkpoint}'",
+            "checkpoint": checkpoint
+        }
+    
+    def diff_checkpoints(self, base: str, target: str = None) -> Dict[str, Any]:
+        """
+        Compare two checkpoints note by note.
+        
+        Checkpoints branched from one another share child lists until one side
+        changes them, so a list that is the same object on both sides is skipped
+        with one identity check. Only the notes in lists that differ are compared,
+        which makes the diff proportional to what changed, not to the canvas.
+        
+        Args:
+            base: The checkpoint to compare from
+            target: The checkpoint to compare to (defaults to the current one)
+            
+        Returns:
+            Dict with "added" ({id, parentId, note}), "removed" ({id, parentId, title}),
+            "moved" ({id, title, from, to}) and "edited" ({id, title, fields: {name: {from, to}}})
+            lists, or an "error" if a checkpoint does not exist
+        """
+        target = target or self.current_checkpoint
+        for checkpoint in (base, target):
+            if not self._has_checkpoint(checkpoint):
+                return {"from": base, "to": target, "error": f"Checkpoint '{checkpoint}' does not exist."}
+        
+        base_data = self.knowledge_base[base]
+        target_data = self.knowledge_base[target]
+        
+        # id -> (note, parent ID) for every note in a child list that differs
+        base_notes: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        target_notes: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        skipped = 0
+        for parent_id in dict.fromkeys([*base_data, *target_data]):
+            base_children = base_data.get(parent_id)
+            target_children = target_data.get(parent_id)
+            if base_children is target_children:
+                skipped += 1
+                continue
+            for note in base_children or []:
+                base_notes.setdefault(note["id"], (note, parent_id))
+            for note in target_children or []:
+                target_notes.setdefault(note["id"], (note, parent_id))
+        
+        diff = {"from": base, "to": target, "added": [], "removed": [], "moved": [], "edited": [], "sharedLists": skipped}
+        
+        for note_id, (note, parent_id) in target_notes.items():
+            if note_id not in base_notes:
+                diff["added"].append({"id": note_id, "parentId": parent_id, "note": dict(note)})
+                continue
+            
+            old_note, old_parent_id = base_notes[note_id]
+            if old_parent_id != parent_id:
+                diff["moved"].append({"id": note_id, "title": note["title"], "from": old_parent_id, "to": parent_id})
+            if old_note is note:
+                continue
+            
+            fields = {
+                key: {"from": old_note.get(key), "to": note.get(key)}
+                for key in dict.fromkeys([*old_note, *note])
+                # parentId follows the move, which is already reported
+                if key != "parentId" and old_note.get(key) != note.get(key)
+            }
+            if fields:
+                diff["edited"].append({"id": note_id, "title": note["title"], "fields": fields})
+        
+        diff["removed"] = [
+            {"id": note_id, "parentId": parent_id, "title": note["title"]}
+            for note_id, (note, parent_id) in base_notes.items() if note_id not in target_notes
+        ]
+        
+        return diff
+    
     def find_note(self, note_id: str) -> Tuple[Dict[str, Any], str, bool]:
         """
         Find a note in the knowledge base by its ID.
@@ -174,14 +772,38 @@ class HierarchicalDataManager:
             - The parent ID or 'root'
             - Boolean indicating if note was found
         """
-        # Check all levels in current checkpoint
-        for parent_id, notes in self.knowledge_base[self.current_checkpoint].items():
-            for note in notes:
-                if note["id"] == note_id:
-                    return note, parent_id, True
+        entry = self._note_index.get(note_id)
+        if entry:
+            return entry[0], entry[1], True
         
         return None, None, False
     
+    def find_note_checkpoint(self, note: Dict[str, Any]) -> Optional[str]:
+        """
+        Find the checkpoint a note sent by a client belongs to.
+        
+        Checkpoints branched from one another reuse note IDs, so a checkpoint only
+        qualifies if it has a note with the same ID under the same parent. Among
+        those, one whose copy has the same title wins, then the current checkpoint,
+        then the latest.
+        
+        Args:
+            note: The client's copy of the note
+            
+        Returns:
+            The checkpoint ID, or None if no checkpoint holds the note
+        """
+        parent_id = note.get("parentId") or "root"
+        best, best_key = None, None
+        for order, (checkpoint, data) in enumerate(self._checkpoints()):
+            match = next((child for child in data.get(parent_id, []) if child["id"] == note.get("id")), None)
+            if match is None:
+                continue
+            key = (match.get("title") == note.get("title"), checkpoint == self.current_checkpoint, order)
+            if best_key is None or key > best_key:
+                best, best_key = checkpoint, key
+        return best
+    
     def find_notes_by_title(self, title: str) -> List[Tuple[Dict[str, Any], str]]:
         """
         Find notes by title across the knowledge base.
@@ -192,13 +814,7 @@ class HierarchicalDataManager:
         Returns:
             List of tuples containing (note, parent_id)
         """
-        results = []
-        
-        # Check all levels in current checkpoint
-        for parent_id, notes in self.knowledge_base[self.current_checkpoint].items():
-            for note in notes:
-                if note["title"].lower() == title.lower():
-                    results.append((note, parent_id))
+        results = list(self._title_index.get(title.lower(), []))
         
         return results
     
@@ -209,22 +825,17 @@ class HierarchicalDataManager:
         Returns:
             List of selected notes
         """
-        selected_notes = []
-        
-        # Check all levels in current checkpoint
-        for parent_id, notes in self.knowledge_base[self.current_checkpoint].items():
-            for note in notes:
-                if note.get("selected", False):
-                    selected_notes.append(note)
+        selected_notes = list(self._selected_ids.values())
         
         return selected_notes
     
-    def process_information(self, information: str) -> Dict[str, Any]:
+    async def process_information(self, information: str, mode: str = None) -> Dict[str, Any]:
         """
         Process information and update the knowledge base according to selected notes.
         
         Args:
             information: The information to process
+            mode: "sequential", "parallel" or "batched" (defaults to self.processing_mode)
             
         Returns:
             Dict containing the result of the operation
@@ -238,11 +849,19 @@ class HierarchicalDataManager:
                 "message": "No notes are selected. Please select at least one note."
             }
         
-        # Process for each selected note
-        results = []
-        for note in selected_notes:
-            result = self.process_for_note(note["id"], information)
-            results.append(result)
+        mode = mode or self.processing_mode
+        
+        if mode == "batched" and len(selected_notes) > 1 and "remove" not in information.lower():
+            analyses = await self._analyze_batch(selected_notes, information)
+            results = await self._process_in_parallel(selected_notes, information, analyses)
+        elif mode in ("parallel", "batched"):
+            results = await self._process_in_parallel(selected_notes, information)
+        else:
+            # Process for each selected note
+            results = []
+            for note in selected_notes:
+                result = await self.process_for_note(note["id"], information)
+                results.append(result)
         
         # Summarize results
         success = all(r["success"] for r in results)
@@ -253,7 +872,124 @@ class HierarchicalDataManager:
             "details": results
         }
     
-    def process_for_note(self, note_id: str, information: str) -> Dict[str, Any]:
+    async def _process_in_parallel(self, selected_notes: List[Dict[str, Any]], information: str,
+                                   analyses: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Run the per-note LLM analyses concurrently, then apply them in selection order.
+        
+        Only the planning step talks to Gemini, so the knowledge base is mutated
+        serially and note IDs/positions come out the same as in sequential mode.
+        
+        Args:
+            selected_notes: The notes to process
+            information: The information to process
+            analyses: Optional pre-computed analyses by note ID (from a batched call)
+            
+        Returns:
+            List of per-note results, in the same order as selected_notes
+        """
+        analyses = analyses or {}
+        limit = asyncio.Semaphore(self.max_parallel_notes)
+        
+        async def plan(note):
+            async with limit:
+                return await asyncio.wait_for(
+                    self._plan_for_note(note["id"], information, analyses.get(note["id"])),
+                    timeout=self.note_timeout
+                )
+        
+        plans = await asyncio.gather(*(plan(note) for note in selected_notes), return_exceptions=True)
+        
+        results = []
+        for note, apply in zip(selected_notes, plans):
+            if not isinstance(apply, BaseException):
+                try:
+                    results.append(apply())
+                    continue
+                except Exception as e:
+                    apply = e
+            # A failed or timed out note doesn't hold up the others, nor lose their results
+            results.append({
+                "success": False,
+                "message": f"Could not process note '{note['id']}': {str(apply) or type(apply).__name__}"
+            })
+        
+        return results
+    
+    async def _analyze_batch(self, selected_notes: List[Dict[str, Any]], information: str) -> Dict[str, str]:
+        """
+        Extract entities for all selected notes with a single Gemini call.
+        
+        Args:
+            selected_notes: The notes to process
+            information: The information to process
+            
+        Returns:
+            Dict mapping note ID to its "Entities:" block (or parsed entities in JSON
+            mode). Notes the model skipped are left out and get analyzed individually.
+        """
+        notes_text = "\n".join(
+            f"        - ID: {note['id']} | Title: {note['title']} | Context: {note['content']}"
+            for note in selected_notes
+        )
+        
+        structured = self.extraction_mode == "json"
+        if structured:
+            format_instructions = "Respond with JSON containing a \"notes\" list of {noteId, entities: [{title, description, sector}]}."
+        else:
+            format_instructions = """Format your response exactly like this, with one block per note ID:
+        Note: [Note ID]
+        Entities:
+        - Title: [Entity Title] | Description: [Description of Entity] | Sector: [inventory/manufacturing/product/human/shipping/quality/production/music]
+        ..."""
+        
+        prompt = f"""
+        I need to organize this information into notes under each of the notes listed below:
+        
+        "{information}"
+        
+        Notes:
+{notes_text}
+        
+        Task: For each note, identify entities mentioned in this information that should become child notes under it.
+        For each entity:
+        1. Provide a clear title
+        2. Provide a brief description
+        3. Identify the sector it belongs to (inventory, manufacturing, product, human, shipping, quality, production, music)
+        
+        {format_instructions}
+        
+        IMPORTANT: Only extract entities that are explicitly mentioned in the input text.
+        """
+        
+        selected_ids = {note["id"] for note in selected_notes}
+        
+        if structured:
+            extraction = await self._generate_structured(prompt, BatchEntityExtraction)
+            if extraction is None:
+                return {}
+            return {
+                block.noteId: [(entity.title, entity.description, entity.sector) for entity in block.entities]
+                for block in extraction.notes if block.noteId in selected_ids and block.entities
+            }
+        
+        try:
+            analysis_text = await self._generate_text(prompt, cached=True)
+        except Exception as e:
+            print(f"Batched analysis failed, analyzing notes individually: {str(e)}")
+            return {}
+        
+        # re.split with a capture group gives [preamble, id1, block1, id2, block2, ...]
+        parts = re.split(r"^\s*Note:\s*(\S+)\s*$", analysis_text, flags=re.MULTILINE)
+        
+        analyses = {}
+        for note_id, block in zip(parts[1::2], parts[2::2]):
+            if note_id in selected_ids and "- Title:" in block:
+                analyses[note_id] = block
+        
+        return analyses
+    
+    async def process_for_note(self, note_id: str, information: str) -> Dict[str, Any]:
         """
         Process information for a specific note.
         
@@ -264,23 +1000,36 @@ class HierarchicalDataManager:
         Returns:
             Dict containing the result of the operation
         """
+        apply = await self._plan_for_note(note_id, information)
+        return apply()
+    
+    async def _plan_for_note(self, note_id: str, information: str,
+                             analysis: Union[str, List[Tuple[str, str, str]]] = None) -> Callable[[], Dict[str, Any]]:
+        """
+        Ask Gemini how to update a note without touching the knowledge base yet.
+        
+        Args:
+            note_id: The ID of the note to update
+            information: The information to process
+            analysis: Optional pre-computed Entities block or parsed entities for this note
+            
+        Returns:
+            A callable that applies the update and returns the operation result
+        """
         # Check if this is a removal request
         if "remove" in information.lower():
-            return self.process_removal(note_id, information)
+            return await self._plan_removal(note_id, information)
         
         # Find the target note
         target_note, parent_id, found = self.find_note(note_id)
         
         if not found:
-            return {
-                "success": False,
-                "message": f"Note with ID '{note_id}' does not exist."
-            }
+            return partial(dict, success=False, message=f"Note with ID '{note_id}' does not exist.")
         
         # Analyze the information and create/update child notes
-        return self.analyze_and_create_notes(target_note, information)
+        return await self._plan_entity_notes(target_note, information, analysis)
     
-    def process_removal(self, note_id: str, information: str) -> Dict[str, Any]:
+    async def process_removal(self, note_id: str, information: str) -> Dict[str, Any]:
         """
         Process a request to remove information.
         
@@ -291,14 +1040,40 @@ class HierarchicalDataManager:
         Returns:
             Dict containing the result of the operation
         """
+        apply = await self._plan_removal(note_id, information)
+        return apply()
+    
+    async def _plan_removal(self, note_id: str, information: str) -> Callable[[], Dict[str, Any]]:
+        """
+        Ask Gemini which item a removal request targets.
+        
+        Args:
+            note_id: The ID of the note to update
+            information: The information about what to remove
+            
+        Returns:
+            A callable that performs the removal and returns the operation result
+        """
         # Find the target note
         target_note, parent_id, found = self.find_note(note_id)
         
         if not found:
-            return {
-                "success": False,
-                "message": f"Note with ID '{note_id}' does not exist."
-            }
+            return partial(dict, success=False, message=f"Note with ID '{note_id}' does not exist.")
+        
+        # Most requests name an existing child directly, so try that before asking Gemini
+        local_match = self._match_removal_target(note_id, information)
+        if local_match:
+            extraction_metrics["removal_local_match"] += 1
+            return partial(self.remove_item_from_note, note_id, local_match)
+        extraction_metrics["removal_llm"] += 1
+        
+        structured = self.extraction_mode == "json"
+        if structured:
+            format_instructions = "Respond with JSON containing \"item\" and \"type\"."
+        else:
+            format_instructions = """Format your response exactly like this:
+        Item: [the exact item name to remove]
+        Type: [the type of item]"""
         
         # Parse the removal request using Gemini
         prompt = f"""
@@ -310,40 +1085,100 @@ class HierarchicalDataManager:
         1. The exact item to be removed (e.g., country name, method, etc.)
         2. What type of item it is (e.g., country, shipping method, etc.)
         
-        Format your response exactly like this:
-        Item: [the exact item name to remove]
-        Type: [the type of item]
+        {format_instructions}
         """
         
-        try:
-            response = self.model.generate_content(prompt)
-            analysis_text = response.text
-        except AttributeError:
-            # Alternative approach if the API has changed 
+        if structured:
+            target = await self._generate_structured(prompt, RemovalTarget)
+            item_to_remove = target.item.strip() if target else None
+        else:
             try:
-                response = self.model.generate_content(prompt)
-                analysis_text = response.candidates[0].content.parts[0].text
-            except Exception as e:
-                return {
-                    "success": False,
-                    "message": f"API Error: {str(e)}"
-                }
-        
-        # Parse Gemini's response
-        item_match = re.search(r"Item:\s*(.*?)(?:\n|$)", analysis_text)
-        type_match = re.search(r"Type:\s*(.*?)(?:\n|$)", analysis_text)
-        
-        item_to_remove = item_match.group(1).strip() if item_match else None
-        item_type = type_match.group(1).strip() if type_match else None
+                analysis_text = await self._generate_text(prompt, cached=True)
+            except (AttributeError, IndexError) as e:
+                return partial(dict, success=False, message=f"API Error: {str(e)}")
+            
+            # Parse Gemini's response
+            item_match = re.search(r"Item:\s*(.*?)(?:\n|$)", analysis_text)
+            item_to_remove = item_match.group(1).strip() if item_match else None
+            extraction_metrics["text_parsed" if item_to_remove else "text_unparsed"] += 1
         
         if not item_to_remove:
-            return {
-                "success": False,
-                "message": "Could not determine what to remove."
-            }
+            return partial(dict, success=False, message="Could not determine what to remove.")
         
         # Search for the item to remove among children of the target note
-        return self.remove_item_from_note(note_id, item_to_remove)
+        return partial(self.remove_item_from_note, note_id, item_to_remove)
+    
+    # Words in a removal request that never identify the item itself
+    REMOVAL_STOPWORDS = {
+        "remove", "removing", "delete", "drop", "please", "can", "you", "we", "i", "the", "a", "an",
+        "from", "of", "in", "on", "under", "this", "that", "note", "notes", "item", "entry", "list", "and", "to"
+    }
+    # Verbs that introduce the item to remove
+    REMOVAL_VERBS = {"remove", "removing", "delete", "drop"}
+    # Words that end the item and start its context, as in "remove X from the Y list"
+    REMOVAL_CONTEXT_WORDS = {"from", "under", "in", "inside", "within", "out"}
+    
+    def _match_removal_target(self, note_id: str, information: str) -> Optional[str]:
+        """
+        Resolve a removal request against the note's child titles without calling Gemini.
+        
+        Only the object of the remove verb is considered: the words after "remove"
+        (or "delete", "drop") up to a context word like "from" or "under", with
+        filler dropped. A title only mentioned as context, as in "remove Acme from
+        the Suppliers list", never matches. The object must equal a title word for
+        word, or fuzzily match one with a clear margin; anything else is left to Gemini.
+        
+        Args:
+            note_id: The ID of the note whose children may be removed
+            information: The removal request
+            
+        Returns:
+            The matched child title, or None if the match is missing or ambiguous
+        """
+        titles = [child["title"] for child in self._get_children_of_note(note_id)]
+        if not titles:
+            return None
+        
+        words = re.findall(r"[a-z0-9]+", information.lower())
+        verb_positions = [index for index, word in enumerate(words) if word in self.REMOVAL_VERBS]
+        if verb_positions:
+            words = words[verb_positions[0] + 1:]
+        object_words = []
+        for word in words:
+            if word in self.REMOVAL_CONTEXT_WORDS and object_words:
+                break
+            if word not in self.REMOVAL_STOPWORDS:
+                object_words.append(word)
+        if not object_words:
+            return None
+        target = " ".join(object_words)
+        
+        title_keys = {
+            title: " ".join(word for word in re.findall(r"[a-z0-9]+", title.lower())
+                            if word not in self.REMOVAL_STOPWORDS)
+            for title in titles
+        }
+        
+        # Exact: the object is the title, ignoring filler words
+        exact = [title for title, key in title_keys.items() if key == target]
+        if len(exact) == 1:
+            return exact[0]
+        if exact:
+            return None
+        
+        # Fuzzy: the object is a near spelling of exactly one title
+        scores = sorted(
+            ((SequenceMatcher(None, target, key).ratio(), title) for title, key in title_keys.items() if key),
+            reverse=True
+        )
+        if not scores:
+            return None
+        best_score, best_title = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        if best_score >= 0.8 and best_score - runner_up >= 0.1:
+            return best_title
+        
+        return None
     
     def remove_item_from_note(self, parent_id: str, item_to_remove: str) -> Dict[str, Any]:
         """
@@ -363,22 +1198,14 @@ class HierarchicalDataManager:
                 "message": f"Note with ID '{parent_id}' has no child notes."
             }
         
-        children = self.knowledge_base[self.current_checkpoint][parent_id]
         removed = False
         
         # Look for matching title
-        for i, child in enumerate(children):
-            if child["title"].lower() == item_to_remove.lower():
-                # Remove the child
-                removed_child = children.pop(i)
-                
-                # If the removed child had children, remove them too
-                child_id = removed_child["id"]
-                if child_id in self.knowledge_base[self.current_checkpoint]:
-                    del self.knowledge_base[self.current_checkpoint][child_id]
-                
-                removed = True
-                break
+        removed_child = self._find_child_by_title(parent_id, item_to_remove)
+        if removed_child is not None:
+            # Remove the child and everything below it
+            self._remove_subtrees({parent_id: [removed_child]})
+            removed = True
         
         if not removed:
             return {
@@ -391,18 +1218,214 @@ class HierarchicalDataManager:
             "message": f"Removed '{item_to_remove}' successfully."
         }
     
-    def analyze_and_create_notes(self, parent_note: Dict[str, Any], information: str) -> Dict[str, Any]:
+    def remove_notes(self, note_ids: List[str]) -> Dict[str, Any]:
+        """
+        Remove several notes, and all of their descendants, at once.
+        
+        Args:
+            note_ids: IDs of the notes to remove
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        by_parent: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for note_id in dict.fromkeys(note_ids):
+            note, parent_id, found = self.find_note(note_id)
+            if found:
+                by_parent.setdefault(parent_id, []).append(note)
+            else:
+                missing.append(note_id)
+        
+        removed_ids = self._remove_subtrees(by_parent)
+        
+        return {
+            "success": not missing,
+            "message": f"Removed {len(removed_ids)} notes" + (f"; not found: {', '.join(missing)}" if missing else ""),
+            "removed": removed_ids
+        }
+    
+    def move_note(self, note_id: str, new_parent_id: str) -> Dict[str, Any]:
+        """
+        Move a note, with its whole subtree, under another parent.
+        
+        Child lists are keyed by parent ID, so the subtree comes along untouched:
+        the note leaves one list and joins another, plus an O(depth) cycle check.
+        
+        Args:
+            note_id: The note to move
+            new_parent_id: The new parent's ID, or 'root'
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        note, parent_id, found = self.find_note(note_id)
+        if not found:
+            return {
+                "success": False,
+                "message": f"Note with ID '{note_id}' does not exist."
+            }
+        
+        new_parent_id = new_parent_id or "root"
+        ancestor_id = new_parent_id
+        while ancestor_id != "root":
+            if ancestor_id == note_id:
+                return {
+                    "success": False,
+                    "message": f"Cannot move '{note['title']}' under itself or one of its descendants."
+                }
+            _, ancestor_id, ancestor_found = self.find_note(ancestor_id)
+            if not ancestor_found:
+                return {
+                    "success": False,
+                    "message": f"Note with ID '{new_parent_id}' does not exist."
+                }
+        
+        if new_parent_id == parent_id:
+            return {
+                "success": True,
+                "message": f"'{note['title']}' is already there"
+            }
+        if self._find_child_by_title(new_parent_id, note["title"]) is not None:
+            return {
+                "success": False,
+                "message": "A note with this title already exists at this level."
+            }
+        
+        note = self._writable_note(note, parent_id)
+        old_siblings = self._writable_children(parent_id)
+        for position, sibling in enumerate(old_siblings):
+            if sibling is note:
+                del old_siblings[position]
+                break
+        
+        self._unindex_note(note)
+        note["parentId"] = None if new_parent_id == "root" else new_parent_id
+        self._writable_children(new_parent_id).append(note)
+        self._index_note(note, new_parent_id)
+        self._record_change("move", note, new_parent_id)
+        
+        return {
+            "success": True,
+            "message": f"Moved '{note['title']}'"
+        }
+    
+    def _remove_subtrees(self, by_parent: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+        """
+        Detach notes from their parents and delete every descendant.
+        
+        The checkpoint is itself the parent -> children adjacency index (child lists
+        are keyed by parent ID), so the walk only touches the removed subtrees and
+        each parent list is filtered once however many of its children go.
+        
+        Args:
+            by_parent: Notes to remove, grouped by parent ID
+            
+        Returns:
+            IDs of every removed note, in depth-first pre-order: each note comes right
+            before its own descendants, so subtrees are not grouped roots first
+        """
+        checkpoint = self.knowledge_base[self.current_checkpoint]
+        removed_ids = []
+        stack = []
+        
+        for parent_id, notes in by_parent.items():
+            doomed = {id(note) for note in notes}
+            siblings = checkpoint.get(parent_id)
+            if siblings is not None:
+                # A new list, so checkpoints sharing the old one keep their notes
+                checkpoint[parent_id] = [sibling for sibling in siblings if id(sibling) not in doomed]
+                self._mark_owned(children=checkpoint[parent_id])
+            stack.extend((note, parent_id) for note in reversed(notes))
+        
+        # By object, not through the ID index: a duplicated ID is indexed only once,
+        # but every copy still has to be unindexed and reported
+        visited = set()
+        while stack:
+            note, parent_id = stack.pop()
+            if id(note) in visited:
+                # Already removed as part of an ancestor's subtree
+                continue
+            visited.add(id(note))
+            self._unindex_note(note)
+            self._record_change("remove", note, parent_id)
+            removed_ids.append(note["id"])
+            
+            children = checkpoint.pop(note["id"], [])
+            stack.extend((child, note["id"]) for child in reversed(children))
+        
+        return removed_ids
+    
+    async def analyze_and_create_notes(self, parent_note: Dict[str, Any], information: str,
+                                       analysis_text: str = None) -> Dict[str, Any]:
         """
         Analyze information using Gemini and create child notes.
         
         Args:
             parent_note: The parent note
             information: Information to process
+            analysis_text: Optional pre-computed Entities block (skips the Gemini call)
             
         Returns:
             Dict containing the result of the operation
         """
-        parent_id = parent_note["id"]
+        apply = await self._plan_entity_notes(parent_note, information, analysis_text)
+        return apply()
+    
+    async def _plan_entity_notes(self, parent_note: Dict[str, Any], information: str,
+                                 analysis: Union[str, List[Tuple[str, str, str]]] = None) -> Callable[[], Dict[str, Any]]:
+        """
+        Ask Gemini which child notes to create from the information.
+        
+        Args:
+            parent_note: The parent note
+            information: Information to process
+            analysis: Optional pre-computed Entities block or parsed entities (skips the Gemini call)
+            
+        Returns:
+            A callable that creates/updates the child notes and returns the operation result
+        """
+        if isinstance(analysis, list):
+            entity_matches = analysis
+        elif analysis is None and self.extraction_mode == "json":
+            extraction = await self._generate_structured(
+                self._entities_prompt(parent_note, information, structured=True), EntityExtraction
+            )
+            entity_matches = [
+                (entity.title, entity.description, entity.sector) for entity in extraction.entities
+            ] if extraction else []
+        else:
+            if analysis is None:
+                analysis = await self._request_entities(parent_note, information)
+            entity_matches = self._parse_entities(analysis) if analysis is not None else []
+            extraction_metrics["text_parsed" if entity_matches else "text_unparsed"] += 1
+        
+        if not entity_matches:
+            # Fallback to a simpler approach
+            extraction_metrics["simple_fallback"] += 1
+            return await self._plan_simple_information(parent_note, information)
+        
+        return partial(self._apply_entities, parent_note, entity_matches)
+    
+    def _parse_entities(self, analysis_text: str) -> List[Tuple[str, str, str]]:
+        """Parse the (title, description, sector) lines out of a text-format Entities block."""
+        entities_section = re.search(r"Entities:(.*?)$", analysis_text, re.DOTALL)
+        if not entities_section:
+            return []
+        
+        entities_text = entities_section.group(1).strip()
+        return re.findall(r"- Title:\s*(.*?)\s*\|\s*Description:\s*(.*?)\s*\|\s*Sector:\s*(.*?)(?:\n|$)", entities_text, re.DOTALL)
+    
+    def _entities_prompt(self, parent_note: Dict[str, Any], information: str, structured: bool = False) -> str:
+        """Build the single-note entity extraction prompt (for JSON output if structured)."""
+        if structured:
+            format_instructions = "Respond with JSON containing an \"entities\" list of {title, description, sector}."
+        else:
+            format_instructions = """Format your response exactly like this:
+        Entities:
+        - Title: [Entity Title] | Description: [Description of Entity] | Sector: [inventory/manufacturing/product/human/shipping/quality/production/music]
+        - Title: [Entity Title] | Description: [Description of Entity] | Sector: [inventory/manufacturing/product/human/shipping/quality/production/music]
+        ..."""
         
         # Generate prompt for Gemini to extract entities
         prompt = f"""
@@ -418,40 +1441,90 @@ class HierarchicalDataManager:
         2. Provide a brief description
         3. Identify the sector it belongs to (inventory, manufacturing, product, human, shipping, quality, production, music)
         
-        Format your response exactly like this:
-        Entities:
-        - Title: [Entity Title] | Description: [Description of Entity] | Sector: [inventory/manufacturing/product/human/shipping/quality/production/music]
-        - Title: [Entity Title] | Description: [Description of Entity] | Sector: [inventory/manufacturing/product/human/shipping/quality/production/music]
-        ...
+        {format_instructions}
         
         IMPORTANT: Only extract entities that are explicitly mentioned in the input text.
         """
         
+        return prompt
+    
+    async def _request_entities(self, parent_note: Dict[str, Any], information: str) -> Optional[str]:
+        """
+        Ask Gemini for the Entities block for a single note.
+        
+        Args:
+            parent_note: The parent note
+            information: Information to process
+            
+        Returns:
+            The raw analysis text, or None if the API call failed
+        """
+        prompt = self._entities_prompt(parent_note, information)
+        
         try:
-            response = self.model.generate_content(prompt)
-            analysis_text = response.text
-        except AttributeError:
-            try:
-                response = self.model.generate_content(prompt)
-                analysis_text = response.candidates[0].content.parts[0].text
-            except Exception as e:
-                # Fallback to a simpler approach
-                return self.simple_information_processing(parent_note, information)
+            analysis_text = await self._generate_text(prompt, cached=True)
+        except (AttributeError, IndexError):
+            # The response had no usable text
+            return None
         
-        # Parse Gemini's response to extract entities
-        entities_section = re.search(r"Entities:(.*?)$", analysis_text, re.DOTALL)
-        if not entities_section:
-            return self.simple_information_processing(parent_note, information)
+        return analysis_text
+    
+    async def stream_entity_notes(self, parent_note: Dict[str, Any], information: str):
+        """
+        Stream entity extraction for a note, applying each entity as soon as its line completes.
         
-        entities_text = entities_section.group(1).strip()
-        entity_matches = re.findall(r"- Title:\s*(.*?)\s*\|\s*Description:\s*(.*?)\s*\|\s*Sector:\s*(.*?)(?:\n|$)", entities_text, re.DOTALL)
+        Args:
+            parent_note: The parent note
+            information: Information to process
+            
+        Yields:
+            ("note", {"parentId", "status", "note"}) for each created/updated child note, then
+            ("result", result) with the same result dict analyze_and_create_notes returns
+        """
+        parent_id = parent_note["id"]
+        parser = EntityStreamParser()
+        pieces = []
+        updates_made = []
         
-        if not entity_matches:
-            return self.simple_information_processing(parent_note, information)
+        def apply(entities):
+            for entity in entities:
+                result = self._apply_entities(parent_note, [entity])
+                updates_made.extend(result["updates"])
+                note = self._find_child_by_title(parent_id, entity[0].strip())
+                status = "updated" if result["updates"][0].endswith("(updated)") else "new"
+                yield "note", {"parentId": parent_id, "status": status, "note": note}
+        
+        prompt = self._entities_prompt(parent_note, information)
+        async for text in stream_text_async(self.model, prompt, use_cache=True):
+            pieces.append(text)
+            for event in apply(parser.feed(text)):
+                yield event
+        
+        for event in apply(parser.close()):
+            yield event
+        
+        if updates_made:
+            yield "result", {
+                "success": True,
+                "message": f"Updated {parent_note['title']} with new information",
+                "updates": updates_made
+            }
+        else:
+            # Nothing parseable came through, take the usual fallback path
+            yield "result", await self.analyze_and_create_notes(parent_note, information, "".join(pieces))
+    
+    def _apply_entities(self, parent_note: Dict[str, Any], entity_matches: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+        """
+        Create or update child notes from extracted (title, description, sector) entities.
         
-        # Initialize parent's children list if it doesn't exist
-        if parent_id not in self.knowledge_base[self.current_checkpoint]:
-            self.knowledge_base[self.current_checkpoint][parent_id] = []
+        Args:
+            parent_note: The parent note
+            entity_matches: The extracted entities
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        parent_id = parent_note["id"]
         
         # Process each entity
         updates_made = []
@@ -465,22 +1538,21 @@ class HierarchicalDataManager:
                 entity_sector = parent_note["sector"]
             
             # Check if entity already exists as a child
-            existing_entity = None
-            for child in self.knowledge_base[self.current_checkpoint][parent_id]:
-                if child["title"].lower() == entity_title.lower():
-                    existing_entity = child
-                    break
+            existing_entity = self._find_child_by_title(parent_id, entity_title)
             
             # Calculate position for new notes (staggered grid layout)
-            children = self.knowledge_base[self.current_checkpoint][parent_id]
+            children = self._get_children_of_note(parent_id)
             x_pos = 100 + ((len(children) % 3) * 300)
             y_pos = 100 + ((len(children) // 3) * 250)
             
             if existing_entity:
                 # Update existing entity
-                existing_entity["content"] = entity_desc
-                existing_entity["sector"] = entity_sector
-                existing_entity["color"] = self.sector_colors.get(entity_sector, "bg-gray-200")
+                self._update_note(
+                    existing_entity,
+                    content=entity_desc,
+                    sector=entity_sector,
+                    color=self.sector_colors.get(entity_sector, "bg-gray-200")
+                )
                 updates_made.append(entity_title + " (updated)")
             else:
                 # Create new entity
@@ -492,7 +1564,7 @@ class HierarchicalDataManager:
                     entity_sector, 
                     parent_id
                 )
-                self.knowledge_base[self.current_checkpoint][parent_id].append(new_note)
+                self._add_note(parent_id, new_note)
                 updates_made.append(entity_title + " (new)")
         
         return {
@@ -501,21 +1573,157 @@ class HierarchicalDataManager:
             "updates": updates_made
         }
     
-    def generate_feedback(self): 
+    def _describe_note(self, note: Dict[str, Any], max_chars: int = 160) -> str:
+        """One compact prompt line for a note."""
+        content = " ".join(str(note.get("content", "")).split())
+        if len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "..."
+        return f"- {note['title']} [{note.get('sector', '')}]: {content}"
+    
+    def build_prompt_context(self, note_id: str = None, token_budget: int = None) -> str:
         """
-        Generate thought-provoking feedback about the current business plan using Gemini AI.
+        Build a compact text view of the canvas for a prompt, instead of the raw knowledge base.
+        
+        With a note ID the context is that note's ancestors, the note itself, its
+        children and its siblings, followed by the other root areas while the budget
+        lasts. Without one it is an outline of the current checkpoint.
         
+        Args:
+            note_id: The note the prompt is about, if any
+            token_budget: Rough token limit (defaults to self.prompt_context_tokens)
+            
         Returns:
-            Dict[str, Any]: A dictionary containing the feedback message or error details
+            The context text
         """
-        if not self.model:
-            return {"message": "Error occurred", "error": "Gemini model not initialized"}
+        # Roughly 4 characters per token is close enough for budgeting
+        char_budget = (token_budget or self.prompt_context_tokens) * 4
+        checkpoint = self.knowledge_base.get(self.current_checkpoint, {})
+        
+        sections = []
+        note, parent_id, found = self.find_note(note_id) if note_id else (None, None, False)
+        
+        if found:
+            ancestors = []
+            ancestor_id = parent_id
+            while ancestor_id and ancestor_id != "root" and len(ancestors) < 50:
+                ancestor, ancestor_parent_id, ancestor_found = self.find_note(ancestor_id)
+                if not ancestor_found:
+                    break
+                ancestors.insert(0, ancestor)
+                ancestor_id = ancestor_parent_id
+            
+            siblings = [sibling for sibling in checkpoint.get(parent_id, []) if sibling is not note]
+            path_ids = {ancestor["id"] for ancestor in ancestors} | {note["id"]}
+            
+            sections.append(("Updated note", [self._describe_note(note)]))
+            sections.append(("Parent notes (top-level first)", [self._describe_note(a) for a in ancestors]))
+            sections.append(("Child notes", [self._describe_note(c) for c in checkpoint.get(note["id"], [])]))
+            sections.append(("Sibling notes", [self._describe_note(s) for s in siblings]))
+            sections.append(("Other areas", [
+                self._describe_note(root_note, max_chars=60)
+                for root_note in checkpoint.get("root", []) if root_note["id"] not in path_ids
+            ]))
+        else:
+            # Outline of the checkpoint: each root note followed by its children
+            outline = []
+            for root_note in checkpoint.get("root", []):
+                outline.append(self._describe_note(root_note))
+                outline.extend("  " + self._describe_note(child, max_chars=80) for child in checkpoint.get(root_note["id"], []))
+            sections.append(("Planning notes", outline))
+        
+        lines = []
+        used = 0
+        omitted = 0
+        for heading, section_lines in sections:
+            # Headings count against the budget too, so add one only with its first line
+            kept = []
+            section_used = used + len(heading) + 2
+            for line in section_lines:
+                if section_used + len(line) + 1 > char_budget:
+                    omitted += 1
+                    continue
+                kept.append(line)
+                section_used += len(line) + 1
+            
+            if kept:
+                lines.append(f"{heading}:")
+                lines.extend(kept)
+                used = section_used
+        
+        if omitted:
+            lines.append(f"({omitted} more notes omitted)")
+        
+        return "\n".join(lines)
+    
+    def describe_diff(self, diff: Dict[str, Any], token_budget: int = None) -> str:
+        """
+        Turn a diff_checkpoints() result into compact prompt lines.
+        
+        Args:
+            diff: The checkpoint diff
+            token_budget: Rough token limit (defaults to self.prompt_context_tokens)
+            
+        Returns:
+            The change list text
+        """
+        char_budget = (token_budget or self.prompt_context_tokens) * 4
+        
+        def title_of(note_id: str) -> str:
+            if note_id == "root":
+                return "the top level"
+            note, _, found = self.find_note(note_id)
+            return f"'{note['title']}'" if found else f"'{note_id}'"
+        
+        changes = []
+        for entry in diff.get("added", []):
+            changes.append(f"- Added under {title_of(entry['parentId'])}: " + self._describe_note(entry["note"])[2:])
+        for entry in diff.get("removed", []):
+            changes.append(f"- Removed '{entry['title']}'")
+        for entry in diff.get("moved", []):
+            changes.append(f"- Moved '{entry['title']}' from {title_of(entry['from'])} to {title_of(entry['to'])}")
+        for entry in diff.get("edited", []):
+            described = []
+            for name, change in entry["fields"].items():
+                if name in ("title", "content", "sector"):
+                    new_value = " ".join(str(change["to"]).split())
+                    described.append(f"{name} now '{new_value[:120]}'")
+                else:
+                    described.append(f"{name} changed")
+            changes.append(f"- Edited '{entry['title']}': " + "; ".join(described))
+        
+        lines = []
+        used = 0
+        for line in changes:
+            if used + len(line) + 1 > char_budget:
+                lines.append(f"({len(changes) - len(lines)} more changes omitted)")
+                break
+            lines.append(line)
+            used += len(line) + 1
+        
+        return "\n".join(lines) or "(no changes)"
+    
+    def build_feedback_prompt(self, since_checkpoint: str = None) -> str:
+        """
+        Build the prompt for general feedback about the current business plan.
+        
+        Args:
+            since_checkpoint: If set, describe only what changed since this checkpoint
+                instead of outlining the whole plan
             
+        Returns:
+            The prompt text
+        """
+        diff = self.diff_checkpoints(since_checkpoint) if since_checkpoint else None
+        if diff and "error" not in diff:
+            context = f"Changes since {since_checkpoint}:\n" + self.describe_diff(diff)
+        else:
+            context = self.build_prompt_context()
+        
         prompt = f"""
             You are a seasoned business strategist AI analyzing our venture's foundational elements. 
             Carefully examine the core components from our planning notes below:
 
-            {self.knowledge_base}
+{context}
 
             Identify the most significant opportunity to create connective tissue between these operational areas: 
             - Inventory/Supply Chain (including suppliers and stock levels)
@@ -533,30 +1741,45 @@ class HierarchicalDataManager:
             Output only the question itself, without any formatting or commentary.
         """
         
+        return prompt
+    
+    async def generate_feedback(self, since_checkpoint: str = None): 
+        """
+        Generate thought-provoking feedback about the current business plan using Gemini AI.
+        
+        Args:
+            since_checkpoint: If set, only the changes since this checkpoint go into the prompt
+        
+        Returns:
+            Dict[str, Any]: A dictionary containing the feedback message or error details
+        """
+        if not self.model:
+            return {"message": "Error occurred", "error": "Gemini model not initialized"}
+            
+        prompt = self.build_feedback_prompt(since_checkpoint)
+        
         try: 
             # Set safety settings if needed
             # safety_settings = [
             #    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
             # ]
             
-            # Make the API call to Gemini
-            response = self.model.generate_content(prompt)
-            
-            # Check if response has text attribute
-            if hasattr(response, 'text'):
-                feedback = response.text
-                print(f"Successfully generated feedback: {feedback[:100]}...")
-                return {"message": feedback, "status": "success"}
-            else:
-                print(f"Unexpected response format: {response}")
+            # Make the API call to Gemini (an unchanged plan is answered from the cache)
+            try:
+                feedback = await self._generate_text(prompt, cached=True)
+            except (AttributeError, IndexError) as e:
+                print(f"Unexpected response format: {str(e)}")
                 return {"message": "Error occurred", "error": "Unexpected response format"}
+            
+            print(f"Successfully generated feedback: {feedback[:100]}...")
+            return {"message": feedback, "status": "success"}
                 
         except Exception as e: 
             print(f"Error generating feedback: {str(e)}")
             return {"message": "Error occurred", "error": str(e)}
 
 
-    def simple_information_processing(self, parent_note: Dict[str, Any], information: str) -> Dict[str, Any]:
+    async def simple_information_processing(self, parent_note: Dict[str, Any], information: str) -> Dict[str, Any]:
         """
         Simple fallback method for processing information.
         
@@ -567,7 +1790,27 @@ class HierarchicalDataManager:
         Returns:
             Dict containing the result of the operation
         """
-        parent_id = parent_note["id"]
+        apply = await self._plan_simple_information(parent_note, information)
+        return apply()
+    
+    async def _plan_simple_information(self, parent_note: Dict[str, Any], information: str) -> Callable[[], Dict[str, Any]]:
+        """
+        Ask Gemini for 2-3 key points to add under the parent note.
+        
+        Args:
+            parent_note: The parent note
+            information: Information to process
+            
+        Returns:
+            A callable that adds the key points and returns the operation result
+        """
+        structured = self.extraction_mode == "json"
+        if structured:
+            format_instructions = "Respond with JSON containing a \"points\" list of {title, description}."
+        else:
+            format_instructions = """Format each key point as:
+        Title: [short title]
+        Description: [brief description]"""
         
         # Try to extract key points
         prompt = f"""
@@ -575,106 +1818,97 @@ class HierarchicalDataManager:
         
         "{information}"
         
-        Format each key point as:
-        Title: [short title]
-        Description: [brief description]
+        {format_instructions}
         
         Use ONLY information that is explicitly mentioned in the text.
         """
         
+        info_content = information[:150] + "..." if len(information) > 150 else information
+        
         try:
-            response = self.model.generate_content(prompt)
-            points_text = response.text
+            if structured:
+                extraction = await self._generate_structured(prompt, KeyPointExtraction)
+            else:
+                response = await self._generate(prompt)
+                points_text = response.text
         except:
             # Create a generic "Information" note
-            info_title = "Information"
-            info_content = information[:150] + "..." if len(information) > 150 else information
-            
-            # Initialize parent's children list if it doesn't exist
-            if parent_id not in self.knowledge_base[self.current_checkpoint]:
-                self.knowledge_base[self.current_checkpoint][parent_id] = []
-            
-            # Check if Information note already exists
-            existing_info = None
-            for child in self.knowledge_base[self.current_checkpoint][parent_id]:
-                if child["title"].lower() == info_title.lower():
-                    existing_info = child
-                    break
-            
-            # Calculate position for new note
-            children = self.knowledge_base[self.current_checkpoint][parent_id]
-            x_pos = 100 + ((len(children) % 3) * 300)
-            y_pos = 100 + ((len(children) // 3) * 250)
-            
-            if existing_info:
-                # Update existing Information note
-                existing_info["content"] = existing_info["content"] + " " + info_content
-            else:
-                # Create new Information note
-                new_note = self._create_note(
-                    info_title, 
-                    info_content, 
-                    x_pos, 
-                    y_pos, 
-                    parent_note["sector"], 
-                    parent_id
-                )
-                self.knowledge_base[self.current_checkpoint][parent_id].append(new_note)
-            
-            return {
-                "success": True,
-                "message": f"Added generic information to {parent_note['title']}",
-                "node": info_title
-            }
+            return partial(
+                self._add_fallback_note, parent_note, "Information", info_content,
+                f"Added generic information to {parent_note['title']}"
+            )
         
         # Parse key points
-        point_matches = re.findall(r"Title:\s*(.*?)(?:\n|$).*?Description:\s*(.*?)(?:\n\n|$)", points_text, re.DOTALL)
+        if structured:
+            point_matches = [(point.title, point.description) for point in extraction.points] if extraction else []
+        else:
+            point_matches = re.findall(r"Title:\s*(.*?)(?:\n|$).*?Description:\s*(.*?)(?:\n\n|$)", points_text, re.DOTALL)
         
         if not point_matches:
             # Create a "Details" note
-            details_title = "Details"
-            details_content = information[:150] + "..." if len(information) > 150 else information
-            
-            # Initialize parent's children list if it doesn't exist
-            if parent_id not in self.knowledge_base[self.current_checkpoint]:
-                self.knowledge_base[self.current_checkpoint][parent_id] = []
-            
-            # Check if Details note already exists
-            existing_details = None
-            for child in self.knowledge_base[self.current_checkpoint][parent_id]:
-                if child["title"].lower() == details_title.lower():
-                    existing_details = child
-                    break
-            
-            # Calculate position for new note
-            children = self.knowledge_base[self.current_checkpoint][parent_id]
-            x_pos = 100 + ((len(children) % 3) * 300)
-            y_pos = 100 + ((len(children) // 3) * 250)
-            
-            if existing_details:
-                # Update existing Details note
-                existing_details["content"] = existing_details["content"] + " " + details_content
-            else:
-                # Create new Details note
-                new_note = self._create_note(
-                    details_title, 
-                    details_content, 
-                    x_pos, 
-                    y_pos, 
-                    parent_note["sector"], 
-                    parent_id
-                )
-                self.knowledge_base[self.current_checkpoint][parent_id].append(new_note)
+            return partial(
+                self._add_fallback_note, parent_note, "Details", info_content,
+                f"Added details to {parent_note['title']}"
+            )
+        
+        return partial(self._apply_key_points, parent_note, point_matches)
+    
+    def _add_fallback_note(self, parent_note: Dict[str, Any], title: str, content: str, message: str) -> Dict[str, Any]:
+        """
+        Add (or append to) a catch-all child note when no key points could be extracted.
+        
+        Args:
+            parent_note: The parent note
+            title: Title of the catch-all note ("Information" or "Details")
+            content: The raw information to store
+            message: Message to report on success
             
-            return {
-                "success": True,
-                "message": f"Added details to {parent_note['title']}",
-                "node": details_title
-            }
+        Returns:
+            Dict containing the result of the operation
+        """
+        parent_id = parent_note["id"]
         
-        # Initialize parent's children list if it doesn't exist
-        if parent_id not in self.knowledge_base[self.current_checkpoint]:
-            self.knowledge_base[self.current_checkpoint][parent_id] = []
+        # Check if the note already exists
+        existing_note = self._find_child_by_title(parent_id, title)
+        
+        # Calculate position for new note
+        children = self._get_children_of_note(parent_id)
+        x_pos = 100 + ((len(children) % 3) * 300)
+        y_pos = 100 + ((len(children) // 3) * 250)
+        
+        if existing_note:
+            # Update existing note
+            self._update_note(existing_note, content=existing_note["content"] + " " + content)
+        else:
+            # Create new note
+            new_note = self._create_note(
+                title, 
+                content, 
+                x_pos, 
+                y_pos, 
+                parent_note["sector"], 
+                parent_id
+            )
+            self._add_note(parent_id, new_note)
+        
+        return {
+            "success": True,
+            "message": message,
+            "node": title
+        }
+    
+    def _apply_key_points(self, parent_note: Dict[str, Any], point_matches: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        Create or update child notes from extracted (title, description) key points.
+        
+        Args:
+            parent_note: The parent note
+            point_matches: The extracted key points
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        parent_id = parent_note["id"]
         
         # Add each key point as a note
         points_added = []
@@ -683,20 +1917,16 @@ class HierarchicalDataManager:
             desc = desc.strip()
             
             # Check if note with this title already exists
-            existing_note = None
-            for child in self.knowledge_base[self.current_checkpoint][parent_id]:
-                if child["title"].lower() == title.lower():
-                    existing_note = child
-                    break
+            existing_note = self._find_child_by_title(parent_id, title)
             
             # Calculate position for new note
-            children = self.knowledge_base[self.current_checkpoint][parent_id]
+            children = self._get_children_of_note(parent_id)
             x_pos = 100 + ((len(children) % 3) * 300)
             y_pos = 100 + ((len(children) // 3) * 250)
             
             if existing_note:
                 # Update existing node
-                existing_note["content"] = desc
+                self._update_note(existing_note, content=desc)
                 points_added.append(title + " (updated)")
             else:
                 # Create new node
@@ -708,7 +1938,7 @@ class HierarchicalDataManager:
                     parent_note["sector"], 
                     parent_id
                 )
-                self.knowledge_base[self.current_checkpoint][parent_id].append(new_note)
+                self._add_note(parent_id, new_note)
                 points_added.append(title + " (new)")
         
         return {
@@ -737,13 +1967,42 @@ class HierarchicalDataManager:
             }
         
         # Update selected value - make sure it's True or False, not true or false
-        note["selected"] = True if select else False
+        note = self._update_note(note, selected=True if select else False)
         
         return {
             "success": True,
             "message": f"{'Selected' if select else 'Deselected'} note '{note['title']}'"
         }
     
+    def edit_note(self, note_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply a client-side edit to a note.
+        
+        Args:
+            note_id: The ID of the note
+            fields: The new values; only editable fields are applied
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        note, parent_id, found = self.find_note(note_id)
+        
+        if not found:
+            return {
+                "success": False,
+                "message": f"Note with ID '{note_id}' does not exist."
+            }
+        
+        editable = {"title", "content", "position", "color", "sector", "selected", "files", "zIndex"}
+        updates = {key: value for key, value in fields.items() if key in editable and note.get(key) != value}
+        note = self._update_note(note, **updates)
+        
+        return {
+            "success": True,
+            "message": f"Updated note '{note['title']}'",
+            "fields": sorted(updates)
+        }
+    
     def get_knowledge_base(self) -> Dict[str, Any]:
         """
         Get the current knowledge base.
@@ -798,13 +2057,10 @@ class HierarchicalDataManager:
         """
         try:
             with open(filename, 'r') as f:
-                self.knowledge_base = json.load(f)
+                knowledge_base = json.load(f)
             
             # As per requirement, only use cp-1
-            self.current_checkpoint = "cp-1"
-            
-            # Convert boolean values from lowercase to uppercase if needed
-            self._normalize_boolean_values()
+            self._replace_knowledge_base(knowledge_base, "cp-1")
             
             return {
                 "success": True,
@@ -816,12 +2072,71 @@ class HierarchicalDataManager:
                 "message": f"Error loading data: {str(e)}"
             }
     
+    def open_journal(self, path: str, compact_every: int = None, fsync: bool = None) -> Dict[str, Any]:
+        """
+        Persist this knowledge base through an append-only journal at `path`.
+        
+        If the journal (or its snapshot) already exists the knowledge base is
+        replaced by its replayed state; otherwise the current state becomes the
+        first snapshot. From then on every mutation is appended as it happens.
+        
+        Args:
+            path: Journal file path; the snapshot is stored next to it
+            compact_every: Records between snapshots (defaults to JOURNAL_COMPACT_EVERY)
+            fsync: Whether to fsync every record (defaults to JOURNAL_FSYNC)
+            
+        Returns:
+            Dict containing the result of the operation
+        """
+        if compact_every is None:
+            compact_every = int(os.getenv("JOURNAL_COMPACT_EVERY", "1000"))
+        if fsync is None:
+            fsync = os.getenv("JOURNAL_FSYNC", "false").lower() == "true"
+        
+        journal = KnowledgeBaseJournal(path, compact_every=compact_every, fsync=fsync)
+        try:
+            knowledge_base = journal.replay()
+            if knowledge_base is None:
+                journal.compact(self.knowledge_base)
+                message = f"Started journal at {path}"
+            else:
+                self._replace_knowledge_base(knowledge_base, journal.meta.get("currentCheckpoint", "cp-1"))
+                message = f"Replayed journal from {path}"
+        except Exception as e:
+            journal.close()
+            return {
+                "success": False,
+                "message": f"Error opening journal: {str(e)}"
+            }
+        
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = journal
+        
+        return {
+            "success": True,
+            "message": message
+        }
+    
+    def _replace_knowledge_base(self, knowledge_base: Dict[str, Any], checkpoint: str):
+        """Swap in a whole new knowledge base and reset everything derived from the old one."""
+        self.knowledge_base = knowledge_base
+        self.current_checkpoint = checkpoint
+        
+        # Convert boolean values from lowercase to uppercase if needed
+        self._normalize_boolean_values()
+        self._rebuild_index()
+        self._checkpoint_indexes = OrderedDict()
+        self._id_seeds = None
+        self._owned = {}
+        self._changes = self._empty_changes()
+    
     def _normalize_boolean_values(self):
         """
         Normalize boolean values to be True/False instead of true/false
         """
         # Process all notes in the knowledge base
-        for checkpoint, data in self.knowledge_base.items():
+        for checkpoint, data in self._checkpoints():
             for parent_id, notes in data.items():
                 for note in notes:
                     # Convert 'selected' to proper Python boolean if it's a string
@@ -839,10 +2154,12 @@ class HierarchicalDataManager:
 
 
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Any
-from models import StickyNote, StickyNoteTree
+from models import StickyNote, StickyNoteTree, StickyNoteNotFound
 import json
 import google.generativeai as genai
 import os
@@ -861,7 +2178,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-tree = StickyNoteTree()
+# "memory" keeps sticky notes and canvases in this process only; "sqlite" shares them
+# through the database at STORAGE_PATH, across restarts and uvicorn workers
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+STORAGE_PATH = os.getenv("STORAGE_PATH", "genesis.db")
+
+tree = SqliteStickyNoteTree(STORAGE_PATH) if STORAGE_BACKEND == "sqlite" else StickyNoteTree()
+canvas_store = SqliteCanvasStore(STORAGE_PATH) if STORAGE_BACKEND == "sqlite" else None
+
+@app.on_event("startup")
+async def configure_threadpool():
+    """Size the threadpool the sync endpoints run on (THREADPOOL_LIMIT, anyio's default is 40)."""
+    limit = os.getenv("THREADPOOL_LIMIT")
+    if limit:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(limit)
+
+@app.on_event("startup")
+async def warm_model_registry():
+    """Resolve the Gemini model once at startup instead of on the first request."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key:
+        await model_registry.get_model_async(api_key)
 
 class StickyNoteRequest(BaseModel):
     path: List[str]
@@ -875,11 +2212,22 @@ class EditStickyNoteRequest(BaseModel):
 class DeleteStickyNoteRequest(BaseModel):
     path: List[str]
 
+class StickyNoteFields(BaseModel):
+    title: str
+    description: str
+
+class MoveStickyNoteRequest(BaseModel):
+    path: List[str]
+    newParentPath: List[str]
+
+class MoveStickyNoteByIdRequest(BaseModel):
+    newParentId: str
+
 class SpeechToTextRequest(BaseModel):
     text: str
 
 class CanvasHierarchyModel(BaseModel):
-    canvasHierarchy: Dict[str, Dict[str, List[Any]]]
+    canvasHierarchy: Dict[str, Union[Dict[str, List[Any]], Dict[str, int]]]
 
 # Define a root endpoint
 @app.get("/")
@@ -894,8 +2242,8 @@ def read_item(item_id: int, q: str = None):
 @app.post("/api/add-sticky")
 def add_sticky(data: StickyNoteRequest):
     try:
-        tree.traverse_and_add(data.path, data.sticky["title"], data.sticky["description"])
-        return {"message": "Sticky note added successfully"}
+        note_id = tree.traverse_and_add(data.path, data.sticky["title"], data.sticky["description"])
+        return {"message": "Sticky note added successfully", "noteId": note_id}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -909,59 +2257,8 @@ def edit_sticky(data: EditStickyNoteRequest):
         # Print the received data for debugging
         print(f"Edit request received: {data}")
         
-        # Validate the path
-        if not data.path:
-            raise ValueError("Invalid path: empty path provided")
-            
-        # Traverse the tree to find the note
-        current = tree.root
-        
-        # If path is empty or just contains one element (like ["root"]), we're editing a top-level note
-        if len(data.path) <= 1:
-            # We're editing a direct child of root
-            title_to_edit = data.path[0] if data.path else None
-            if title_to_edit and title_to_edit in current.children:
-                note = current.children[title_to_edit]
-                # Update the note
-                old_title = note.title
-                note.title = data.title
-                note.description = data.description
-                
-                # If title changed, we need to update the key in the parent's children dict
-                if old_title != data.title:
-                    current.children[data.title] = note
-                    del current.children[old_title]
-                
-                return {"message": "Sticky note updated successfully"}
-            else:
-                raise ValueError(f"Note '{title_to_edit}' not found")
-        else:
-            # We're editing a nested note
-            # Navigate to the parent of the note to edit
-            for i in range(len(data.path) - 1):
-                level = data.path[i]
-                if level in current.children:
-                    current = current.children[level]
-                else:
-                    raise ValueError(f"Path '{level}' does not exist")
-            
-            # Now current is the parent of the note to edit
-            title_to_edit = data.path[-1]
-            if title_to_edit in current.children:
-                note = current.children[title_to_edit]
-                # Update the note
-                old_title = note.title
-                note.title = data.title
-                note.description = data.description
-                
-                # If title changed, we need to update the key in the parent's children dict
-                if old_title != data.title:
-                    current.children[data.title] = note
-                    del current.children[old_title]
-                
-                return {"message": "Sticky note updated successfully"}
-            else:
-                raise ValueError(f"Note '{title_to_edit}' not found")
+        tree.edit_note(data.path, data.title, data.description)
+        return {"message": "Sticky note updated successfully"}
     
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -978,58 +2275,120 @@ def delete_sticky(data: DeleteStickyNoteRequest):
         # Print the received data for debugging
         print(f"Delete request received: {data}")
         
-        # Validate the path
-        if not data.path:
-            raise ValueError("Cannot delete root note")
-            
-        # Traverse the tree to find the parent of the note to delete
-        current = tree.root
-        
-        # If path only contains one element, we're deleting a top-level note
-        if len(data.path) == 1:
-            title_to_delete = data.path[0]
-            if title_to_delete in current.children:
-                del current.children[title_to_delete]
-                return {"message": "Sticky note deleted successfully"}
-            else:
-                raise ValueError(f"Note '{title_to_delete}' not found")
-        else:
-            # We're deleting a nested note
-            # Navigate to the parent of the note to delete
-            for i in range(len(data.path) - 1):
-                level = data.path[i]
-                if level in current.children:
-                    current = current.children[level]
-                else:
-                    raise ValueError(f"Path '{level}' does not exist")
-            
-            # Now current is the parent of the note to delete
-            title_to_delete = data.path[-1]
-            if title_to_delete in current.children:
-                del current.children[title_to_delete]
-                return {"message": "Sticky note deleted successfully"}
-            else:
-                raise ValueError(f"Note '{title_to_delete}' not found")
+        tree.delete_note(data.path)
+        return {"message": "Sticky note deleted successfully"}
     
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting sticky note: {str(e)}")
 
-@app.get("/api/sticky-tree")
-def get_sticky_tree():
+@app.put("/api/move-sticky")
+def move_sticky(data: MoveStickyNoteRequest):
     """
-    Returns all sticky notes in a tree format.
+    Move a sticky note and all its children under another note.
+    The path parameters identify the note and its new parent ([] for the top level).
+    """
+    try:
+        tree.move_note(data.path, data.newParentPath)
+        return {"message": "Sticky note moved successfully"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/sticky/{note_id}")
+def get_sticky(note_id: str):
+    """
+    Returns one sticky note by its stable ID, with its parent and child IDs.
     """
     try:
-        # Convert the tree to a dictionary format for JSON response
-        tree_data = tree.to_dict()
-        
         return {
             "status": "success",
             "timestamp": datetime.now().isoformat(),
-            "data": tree_data
+            "data": tree.note_info(note_id)
         }
+    except StickyNoteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/sticky/{parent_id}/children")
+def add_sticky_child(parent_id: str, data: StickyNoteFields):
+    """
+    Add a sticky note under the note with parent_id ('root' for the top level).
+    """
+    try:
+        note_id = tree.add_note(parent_id, data.title, data.description)
+        return {"message": "Sticky note added successfully", "noteId": note_id}
+    except StickyNoteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/api/sticky/{note_id}")
+def edit_sticky_by_id(note_id: str, data: StickyNoteFields):
+    """
+    Edit a sticky note's title and description by its stable ID.
+    """
+    try:
+        tree.edit_note_by_id(note_id, data.title, data.description)
+        return {"message": "Sticky note updated successfully"}
+    except StickyNoteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/sticky/{note_id}/move")
+def move_sticky_by_id(note_id: str, data: MoveStickyNoteByIdRequest):
+    """
+    Move a sticky note and all its children under another note ('root' for the top level).
+    """
+    try:
+        tree.move_note_by_id(note_id, data.newParentId)
+        return {"message": "Sticky note moved successfully"}
+    except StickyNoteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/sticky/{note_id}")
+def delete_sticky_by_id(note_id: str):
+    """
+    Delete a sticky note and all its children by its stable ID.
+    """
+    try:
+        tree.delete_note_by_id(note_id)
+        return {"message": "Sticky note deleted successfully"}
+    except StickyNoteNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the given ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+@app.get("/api/sticky-tree")
+def get_sticky_tree(if_none_match: Optional[str] = Header(None)):
+    """
+    Returns all sticky notes in a tree format.
+    
+    The response carries an ETag of the tree version. Polls that send it back in
+    If-None-Match get 304 until the tree changes.
+    """
+    try:
+        etag = f'"{tree.version}"'
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        # Already-encoded JSON, so only subtrees changed since the last poll are serialized
+        version, tree_json = tree.to_json()
+        etag = f'"{version}"'
+        body = (
+            f'{{"status":"success","timestamp":{json.dumps(datetime.now().isoformat())},'
+            f'"data":{tree_json}}}'
+        )
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving sticky tree: {str(e)}")
@@ -1255,7 +2614,8 @@ async def update_canvas(data: CanvasHierarchyModel):
 # NEW: Endpoint to update canvas hierarchy based on a user question
 class UpdateHierarchyRequest(BaseModel):
     question: str  # Changed from 'question' to match frontend
-    canvasHierarchy: Dict[str, Dict[str, List[Dict]]]  # More specific typing
+    canvasHierarchy: Dict[str, Union[Dict[str, List[Dict]], Dict[str, int]]]  # More specific typing
+    responseFormat: str = "full"  # "full" returns the whole hierarchy, "patch" only what changed
 
 # Configure Gemini
 #model = genai.GenerativeModel('gemini-1.5-pro')
@@ -1265,49 +2625,95 @@ class UpdateHierarchyRequest(BaseModel):
 @app.post("/api/update-hierarchy")
 async def update_hierarchy(data: UpdateHierarchyRequest):
     #OPEN JASON FILE HERE
-    manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy)
+    # Refresh a stale model handle off the event loop and hand it to the manager
+    model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+    manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy, model=model)
 
     #ENTER PROMPT HERE
-    result = manager.process_information(data.question)
-    #Create a new checkpoint (version)
-    manager.create_checkpoint()
+    result = await manager.process_information(data.question)
+
+    if data.responseFormat == "patch":
+        # Only the notes process_information touched, see HierarchicalDataManager.take_changes
+        return {"patch": manager.take_changes(), "result": result}
+
     current_data = manager.get_current_checkpoint()
     print(manager.get_knowledge_base())
 
     return manager.get_knowledge_base()
 
+class CheckpointDiffRequest(BaseModel):
+    canvasHierarchy: Dict[str, Union[Dict[str, List[Dict]], Dict[str, int]]]
+    fromCheckpoint: str
+    toCheckpoint: str
+
+@app.post("/api/checkpoint-diff")
+async def diff_checkpoints(data: CheckpointDiffRequest):
+    """Added, removed, moved and edited notes between two checkpoints of an uploaded canvas."""
+    model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+    manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy, model=model)
+    diff = manager.diff_checkpoints(data.fromCheckpoint, data.toCheckpoint)
+    if "error" in diff:
+        raise HTTPException(status_code=404, detail=diff["error"])
+    return diff
+
+@app.get("/api/extraction-metrics")
+def get_extraction_metrics():
+    """
+    Returns how often entity/removal extraction parsed cleanly and how often it fell back.
+    """
+    return {
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "data": dict(extraction_metrics)
+    }
+
+@app.get("/api/llm-cache")
+def get_llm_cache_stats():
+    """
+    Returns hit/miss counters for the Gemini response cache.
+    """
+    return {
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "data": response_cache.stats()
+    }
+
 # Add this new model class for the updated feedback endpoint
 class UpdatedNoteModel(BaseModel):
-    canvasHierarchy: Dict[str, Dict[str, List[Any]]]
+    canvasHierarchy: Dict[str, Union[Dict[str, List[Any]], Dict[str, int]]]
     updatedNote: Optional[Dict[str, Any]] = None
+    checkpoint: Optional[str] = None  # the updated note's checkpoint, found from the note if not given
     originalNote: Optional[Dict[str, Any]] = None
     changes: Optional[Dict[str, bool]] = None
+    sinceCheckpoint: Optional[str] = None  # general feedback on the diff from this checkpoint only
 
-# Update the feedback endpoint to use the new model and include note context
-@app.post("/api/feedback")
-async def receive_feedback(data: UpdatedNoteModel):
-    try:
-        # Process the canvas hierarchy data
-        manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy)
+def build_note_feedback_prompt(manager: HierarchicalDataManager, data: UpdatedNoteModel) -> str:
+    """
+    Build the feedback prompt for a single updated note.
+    
+    Args:
+        manager: Manager holding the canvas the note belongs to
+        data: The feedback request
         
-        # Create a more targeted prompt based on the updated note
-        if data.updatedNote:
-            # Extract information about the updated note
-            note_title = data.updatedNote.get("title", "")
-            note_content = data.updatedNote.get("content", "")
-            note_sector = data.updatedNote.get("sector", "")
-            
-            # Get information about what changed
-            changes = data.changes or {}
-            changed_title = changes.get("title", False)
-            changed_content = changes.get("content", False)
-            
-            # Get original note information if available
-            original_title = data.originalNote.get("title", "") if data.originalNote else ""
-            original_content = data.originalNote.get("content", "") if data.originalNote else ""
-            
-            # Create a custom prompt that includes the specific note context
-            custom_prompt = f"""
+    Returns:
+        The prompt text
+    """
+    # Extract information about the updated note
+    note_title = data.updatedNote.get("title", "")
+    note_content = data.updatedNote.get("content", "")
+    note_sector = data.updatedNote.get("sector", "")
+    
+    # Get information about what changed
+    changes = data.changes or {}
+    changed_title = changes.get("title", False)
+    changed_content = changes.get("content", False)
+    
+    # Get original note information if available
+    original_title = data.originalNote.get("title", "") if data.originalNote else ""
+    original_content = data.originalNote.get("content", "") if data.originalNote else ""
+    
+    # Create a custom prompt that includes the specific note context
+    return f"""
     You are a seasoned business strategist AI analyzing our venture's foundational elements.
     
     A business note has just been updated with the following changes:
@@ -1317,7 +2723,7 @@ async def receive_feedback(data: UpdatedNoteModel):
     Sector: {note_sector}
     
     Based on this specific update and considering the broader business context:
-    {manager.knowledge_base}
+{manager.build_prompt_context(data.updatedNote.get("id"))}
     
     Generate one piercing question that:
     1) Connects this specific update to other operational areas
@@ -1333,23 +2739,52 @@ async def receive_feedback(data: UpdatedNoteModel):
     
     Do not include any additional text, commentary, or formatting.
 """
+
+async def open_feedback_manager(data: UpdatedNoteModel) -> HierarchicalDataManager:
+    """
+    Load the canvas of a feedback request, switched to the updated note's checkpoint.
+    
+    Args:
+        data: The feedback request
+        
+    Returns:
+        A manager whose current checkpoint holds the updated note, if there is one
+    """
+    model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+    manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy, model=model)
+    
+    # The client edits notes on any checkpoint, and the prompt context only covers the current one
+    if data.updatedNote:
+        checkpoint = data.checkpoint if manager._has_checkpoint(data.checkpoint or "") else None
+        checkpoint = checkpoint or manager.find_note_checkpoint(data.updatedNote)
+        if checkpoint:
+            manager.switch_checkpoint(checkpoint)
+    return manager
+
+# Update the feedback endpoint to use the new model and include note context
+@app.post("/api/feedback")
+async def receive_feedback(data: UpdatedNoteModel):
+    try:
+        # Process the canvas hierarchy data
+        manager = await open_feedback_manager(data)
+        
+        # Create a more targeted prompt based on the updated note
+        if data.updatedNote:
+            custom_prompt = build_note_feedback_prompt(manager, data)
             
             # Generate feedback using the custom prompt
-            response = manager.model.generate_content(custom_prompt)
-            
-            # Check if response has text attribute
-            if hasattr(response, 'text'):
-                feedback = response.text
+            try:
+                feedback = await manager._generate_text(custom_prompt, cached=True)
                 print(f"Successfully generated feedback: {feedback[:100]}...")
                 return {
                     "status": "success", 
                     "message": feedback,
                     "feedback": feedback
                 }
-            else:
-                print(f"Unexpected response format: {response}")
+            except (AttributeError, IndexError) as e:
+                print(f"Unexpected response format: {str(e)}")
                 # Fall back to the general feedback method
-                response = manager.generate_feedback()
+                response = await manager.generate_feedback()
                 return {
                     "status": "success", 
                     "message": response["message"],
@@ -1357,7 +2792,7 @@ async def receive_feedback(data: UpdatedNoteModel):
                 }
         else:
             # If no specific note was updated, use the general feedback method
-            response = manager.generate_feedback()
+            response = await manager.generate_feedback(data.sinceCheckpoint)
             
             if response["message"] == "Error occurred":
                 raise Exception("Failed to generate feedback")
@@ -1370,3 +2805,418 @@ async def receive_feedback(data: UpdatedNoteModel):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing feedback: {str(e)}")
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/feedback/stream")
+async def stream_feedback(data: UpdatedNoteModel):
+    """
+    Same prompts as /api/feedback, but streamed as server-sent events.
+    
+    Emits a "token" event per chunk ({"text": ...}), then a "done" event with the
+    full feedback, or an "error" event if generation fails part way through.
+    """
+    manager = await open_feedback_manager(data)
+    
+    if data.updatedNote:
+        prompt = build_note_feedback_prompt(manager, data)
+    else:
+        prompt = manager.build_feedback_prompt(data.sinceCheckpoint)
+    
+    async def events():
+        pieces = []
+        try:
+            async for text in stream_text_async(manager.model, prompt, use_cache=True):
+                pieces.append(text)
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            print(f"Error streaming feedback: {str(e)}")
+            yield sse_event("error", {"status": "error", "detail": f"Error processing feedback: {str(e)}"})
+            return
+        
+        feedback = "".join(pieces)
+        yield sse_event("done", {"status": "success", "message": feedback, "feedback": feedback})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/update-hierarchy/stream")
+async def stream_update_hierarchy(data: UpdateHierarchyRequest):
+    """
+    Same as /api/update-hierarchy, but child notes are pushed as server-sent events
+    as soon as the model finishes each entity line.
+    
+    Emits "note" events ({"parentId", "status", "note"}), a "result" event per selected
+    note, then "done" with the full knowledge base (or {"patch": ...} when
+    responseFormat is "patch"). Removal requests are not streamed and only produce
+    the final events.
+    """
+    model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+    manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy, model=model)
+    
+    async def events():
+        try:
+            selected_notes = manager.get_selected_notes()
+            
+            if not selected_notes or "remove" in data.question.lower():
+                result = await manager.process_information(data.question)
+                yield sse_event("result", result)
+            else:
+                for note in selected_notes:
+                    async for event, payload in manager.stream_entity_notes(note, data.question):
+                        yield sse_event(event, payload)
+        except Exception as e:
+            print(f"Error streaming hierarchy update: {str(e)}")
+            yield sse_event("error", {"status": "error", "detail": str(e)})
+            return
+        
+        if data.responseFormat == "patch":
+            yield sse_event("done", {"patch": manager.take_changes()})
+        else:
+            yield sse_event("done", manager.get_knowledge_base())
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class CanvasSession:
+    """A canvas held on the server, with a version bumped on every change."""
+    
+    def __init__(self, canvas_id: str, manager: HierarchicalDataManager, history_size: int = 50,
+                 store: Optional[SqliteCanvasStore] = None):
+        self.canvas_id = canvas_id
+        self.manager = manager
+        self.store = store
+        self.version = 0
+        self.lock = asyncio.Lock()
+        # (version, patch) pairs, so a client a few versions behind can catch up
+        self.history = deque(maxlen=history_size)
+    
+    async def commit(self) -> Dict[str, Any]:
+        """Turn the manager's pending changes into the next version."""
+        patch = self.manager.take_changes()
+        if any(patch.values()):
+            # sqlite3 blocks, so store calls run on the threadpool rather than the event loop
+            if self.store is not None and not await run_in_threadpool(
+                self.store.apply_patch, self.canvas_id, patch, self.version, self.version + 1
+            ):
+                # Another worker committed first; the next get() reloads this canvas from the store
+                self.version = -1
+                raise HTTPException(status_code=409, detail="Canvas was changed by another request; reload the canvas")
+            self.version += 1
+            self.history.append((self.version, patch))
+            if self.manager.journal is not None:
+                self.manager.journal.set_meta(version=self.version)
+        return patch
+    
+    def patches_since(self, base_version: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the patches that take a client from base_version to the current version.
+        
+        Returns:
+            List of {"version", "patch"} entries, or None if base_version is too old
+            (or from the future) and the client has to reload the whole canvas
+        """
+        if base_version == self.version:
+            return []
+        if base_version > self.version or not self.history or self.history[0][0] > base_version + 1:
+            return None
+        return [{"version": version, "patch": patch} for version, patch in self.history if version > base_version]
+
+class CanvasSessionStore:
+    """
+    In-process canvas sessions, evicting the least recently used past max_sessions.
+    
+    With a journal_dir every session journals its mutations to <canvas_id>.jsonl
+    there, so a canvas evicted from memory or lost in a restart is replayed from
+    disk the next time it is requested.
+    """
+    
+    def __init__(self, max_sessions: int = 100, journal_dir: Optional[str] = None,
+                 store: Optional[SqliteCanvasStore] = None):
+        self.max_sessions = max_sessions
+        self.journal_dir = journal_dir
+        # With a store, canvases live in SQLite and the in-process sessions are only a cache
+        self.store = store
+        self._sessions: "OrderedDict[str, CanvasSession]" = OrderedDict()
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+    
+    def _journal_path(self, canvas_id: str) -> str:
+        return os.path.join(self.journal_dir, f"{canvas_id}.jsonl")
+    
+    def _store(self, session: CanvasSession):
+        self._sessions[session.canvas_id] = session
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            if evicted.manager.journal is not None:
+                evicted.manager.journal.close()
+    
+    async def create(self, manager: HierarchicalDataManager) -> CanvasSession:
+        session = CanvasSession(uuid.uuid4().hex, manager, store=self.store)
+        if self.store is not None:
+            await run_in_threadpool(
+                self.store.create, session.canvas_id, manager.get_knowledge_base(), manager.current_checkpoint
+            )
+        elif self.journal_dir:
+            result = manager.open_journal(self._journal_path(session.canvas_id))
+            if not result["success"]:
+                raise HTTPException(status_code=500, detail=result["message"])
+        self._store(session)
+        return session
+    
+    async def get(self, canvas_id: str) -> CanvasSession:
+        session = self._sessions.get(canvas_id)
+        if (session is not None and self.store is not None
+                and await run_in_threadpool(self.store.version, canvas_id) != session.version):
+            # Changed (or deleted) by another worker since this one cached it
+            self._sessions.pop(canvas_id, None)
+            session = None
+        if session is None:
+            # Resolved off the event loop here, so rebuilding the manager never calls list_models() on it
+            model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+            session = await self._load(canvas_id, model) if self.store is not None else self._recover(canvas_id, model)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Canvas '{canvas_id}' not found")
+        self._sessions.move_to_end(canvas_id)
+        return session
+    
+    async def _load(self, canvas_id: str, model: "genai.GenerativeModel") -> Optional[CanvasSession]:
+        """Load a canvas from the SQLite store, if it is there."""
+        loaded = await run_in_threadpool(self.store.load, canvas_id)
+        if loaded is None:
+            return None
+        
+        knowledge_base, version, current_checkpoint = loaded
+        manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), knowledge_base, model=model)
+        manager.switch_checkpoint(current_checkpoint)
+        # Where the stored canvas already is, not a change to commit
+        manager.take_changes()
+        
+        session = CanvasSession(canvas_id, manager, store=self.store)
+        session.version = version
+        self._store(session)
+        return session
+    
+    def _recover(self, canvas_id: str, model: "genai.GenerativeModel") -> Optional[CanvasSession]:
+        """Replay a canvas from its journal, if it has one."""
+        # Canvas IDs are uuid4 hex, anything else is not a file name we wrote
+        if not self.journal_dir or not re.fullmatch(r"[0-9a-f]{32}", canvas_id):
+            return None
+        path = self._journal_path(canvas_id)
+        if not os.path.exists(path) and not os.path.exists(path + ".snapshot"):
+            return None
+        
+        manager = HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), {"cp-1": {"root": []}}, model=model)
+        result = manager.open_journal(path)
+        if not result["success"]:
+            print(f"Could not recover canvas {canvas_id}: {result['message']}")
+            return None
+        
+        session = CanvasSession(canvas_id, manager)
+        # Clients on an older version have no history to catch up from, so they get a 409 and reload
+        session.version = manager.journal.meta.get("version", 0)
+        self._store(session)
+        return session
+
+canvas_sessions = CanvasSessionStore(
+    max_sessions=int(os.getenv("CANVAS_SESSION_LIMIT", "100")),
+    journal_dir=os.getenv("CANVAS_JOURNAL_DIR") or None,
+    store=canvas_store
+)
+
+class CreateCanvasRequest(BaseModel):
+    canvasHierarchy: Dict[str, Union[Dict[str, List[Dict]], Dict[str, int]]]
+
+class CanvasQuestionRequest(BaseModel):
+    question: str
+    baseVersion: int
+    selectedNoteIds: Optional[List[str]] = None
+
+class CanvasRemoveNotesRequest(BaseModel):
+    noteIds: List[str]
+    baseVersion: int
+
+class CanvasMoveNoteRequest(BaseModel):
+    noteId: str
+    newParentId: str
+    baseVersion: int
+
+class CanvasCheckpointRequest(BaseModel):
+    baseVersion: int
+    checkpoint: Optional[str] = None
+
+class CanvasFeedbackRequest(BaseModel):
+    baseVersion: int
+    updatedNote: Optional[Dict[str, Any]] = None
+    originalNote: Optional[Dict[str, Any]] = None
+    changes: Optional[Dict[str, bool]] = None
+    sinceCheckpoint: Optional[str] = None
+
+def require_base_version(session: CanvasSession, base_version: int) -> List[Dict[str, Any]]:
+    """Patches from base_version to the current version, or 409 if the client has to reload."""
+    patches = session.patches_since(base_version)
+    if patches is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Base version {base_version} is too far from current version {session.version}; reload the canvas"
+        )
+    return patches
+
+def session_delta(session: CanvasSession, base_version: int) -> Dict[str, Any]:
+    """Response body carrying everything the client needs to reach the current version."""
+    patches = require_base_version(session, base_version)
+    return {"canvasId": session.canvas_id, "version": session.version, "patches": patches}
+
+@app.post("/api/canvas")
+async def create_canvas(data: CreateCanvasRequest):
+    """
+    Upload a canvas hierarchy once and keep it on the server.
+    Later calls send only questions or note changes against a version.
+    """
+    model = await model_registry.get_model_async(os.getenv("GEMINI_API_KEY"))
+    session = await canvas_sessions.create(
+        HierarchicalDataManager(os.getenv("GEMINI_API_KEY"), data.canvasHierarchy, model=model)
+    )
+    return {"canvasId": session.canvas_id, "version": session.version}
+
+@app.get("/api/canvas/{canvas_id}")
+async def get_canvas(canvas_id: str):
+    """Full canvas hierarchy and version, for first load or resync."""
+    session = await canvas_sessions.get(canvas_id)
+    return {
+        "canvasId": session.canvas_id,
+        "version": session.version,
+        "currentCheckpoint": session.manager.current_checkpoint,
+        "canvasHierarchy": session.manager.get_knowledge_base()
+    }
+
+@app.get("/api/canvas/{canvas_id}/changes")
+async def get_canvas_changes(canvas_id: str, since: int):
+    """Patches since a version, for clients that only need to catch up."""
+    return session_delta(await canvas_sessions.get(canvas_id), since)
+
+@app.post("/api/canvas/{canvas_id}/update-hierarchy")
+async def update_canvas_hierarchy(canvas_id: str, data: CanvasQuestionRequest):
+    """Session version of /api/update-hierarchy that answers with patches instead of the whole canvas."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        
+        manager = session.manager
+        if data.selectedNoteIds is not None:
+            wanted = set(data.selectedNoteIds)
+            for note in manager.get_selected_notes():
+                if note["id"] not in wanted:
+                    manager.select_note(note["id"], False)
+            for note_id in data.selectedNoteIds:
+                manager.select_note(note_id, True)
+        
+        result = await manager.process_information(data.question)
+        await session.commit()
+        
+        return {**session_delta(session, data.baseVersion), "result": result}
+
+@app.post("/api/canvas/{canvas_id}/remove-notes")
+async def remove_canvas_notes(canvas_id: str, data: CanvasRemoveNotesRequest):
+    """Remove several notes and their whole subtrees in one call."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        result = session.manager.remove_notes(data.noteIds)
+        await session.commit()
+        
+        return {**session_delta(session, data.baseVersion), "result": result}
+
+@app.post("/api/canvas/{canvas_id}/move-note")
+async def move_canvas_note(canvas_id: str, data: CanvasMoveNoteRequest):
+    """Move a note and its whole subtree under another parent ('root' for the top level)."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        result = session.manager.move_note(data.noteId, data.newParentId)
+        if not result["success"]:
+            raise HTTPException(status_code=400, detail=result["message"])
+        await session.commit()
+        
+        return {**session_delta(session, data.baseVersion), "result": result}
+
+@app.post("/api/canvas/{canvas_id}/checkpoints")
+async def create_canvas_checkpoint(canvas_id: str, data: CanvasCheckpointRequest):
+    """Snapshot a checkpoint (the current one by default) into a new checkpoint and switch to it."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        result = session.manager.create_checkpoint(data.checkpoint)
+        if not result["success"]:
+            raise HTTPException(status_code=404, detail=result["message"])
+        await session.commit()
+        
+        return {**session_delta(session, data.baseVersion), "result": result}
+
+@app.post("/api/canvas/{canvas_id}/switch-checkpoint")
+async def switch_canvas_checkpoint(canvas_id: str, data: CanvasCheckpointRequest):
+    """Make questions and edits on this canvas apply to another checkpoint."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        result = session.manager.switch_checkpoint(data.checkpoint or session.manager._get_latest_checkpoint())
+        if not result["success"]:
+            raise HTTPException(status_code=404, detail=result["message"])
+        # A versioned change, so other workers and clients pick up the switch
+        await session.commit()
+        
+        return {**session_delta(session, data.baseVersion), "result": result}
+
+@app.get("/api/canvas/{canvas_id}/diff")
+async def diff_canvas_checkpoints(canvas_id: str, from_checkpoint: str = Query(..., alias="from"),
+                                  to_checkpoint: Optional[str] = Query(None, alias="to")):
+    """Added, removed, moved and edited notes between two checkpoints (to defaults to the current one)."""
+    session = await canvas_sessions.get(canvas_id)
+    diff = session.manager.diff_checkpoints(from_checkpoint, to_checkpoint)
+    if "error" in diff:
+        raise HTTPException(status_code=404, detail=diff["error"])
+    return {"canvasId": session.canvas_id, "version": session.version, "diff": diff}
+
+@app.post("/api/canvas/{canvas_id}/feedback")
+async def canvas_feedback(canvas_id: str, data: CanvasFeedbackRequest):
+    """Session version of /api/feedback: applies the note change, then generates feedback."""
+    session = await canvas_sessions.get(canvas_id)
+    
+    async with session.lock:
+        require_base_version(session, data.baseVersion)
+        
+        manager = session.manager
+        if data.updatedNote and data.updatedNote.get("id"):
+            manager.edit_note(data.updatedNote["id"], data.updatedNote)
+        await session.commit()
+        
+        try:
+            if data.updatedNote:
+                feedback_request = UpdatedNoteModel(
+                    canvasHierarchy={},
+                    updatedNote=data.updatedNote,
+                    originalNote=data.originalNote,
+                    changes=data.changes
+                )
+                feedback = await manager._generate_text(build_note_feedback_prompt(manager, feedback_request), cached=True)
+            else:
+                response = await manager.generate_feedback(data.sinceCheckpoint)
+                if response["message"] == "Error occurred":
+                    raise Exception(response.get("error", "Failed to generate feedback"))
+                feedback = response["message"]
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing feedback: {str(e)}")
+        
+        return {**session_delta(session, data.baseVersion), "status": "success", "message": feedback, "feedback": feedback}
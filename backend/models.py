@@ -1,19 +1,63 @@
-from typing import List, Optional
+import json
+import threading
+import uuid
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+
+# Shared by every leaf, so notes without children do not each carry an empty dict
+_NO_CHILDREN = MappingProxyType({})
+
+class StickyNoteNotFound(ValueError):
+    """Raised when a note ID is not in the tree."""
 
 class StickyNote:
-    def __init__(self, title: str, description: str):
+    # No per-instance __dict__; most notes in a large tree are leaves, so the
+    # children dict is only created when the first child is added. _fragment caches this
+    # subtree's JSON; a note is only cached while all of its descendants are
+    __slots__ = ("id", "title", "description", "parent", "_children", "_fragment")
+
+    def __init__(self, title: str, description: str, note_id: str = None, parent: "StickyNote" = None):
+        self.id = note_id or uuid.uuid4().hex
         self.title = title
         self.description = description
-        self.children = {}
+        self.parent = parent
+        self._children = None
+        self._fragment = None
+
+    @property
+    def children(self):
+        """Children keyed by title; a read-only empty mapping for leaves."""
+        return self._children if self._children is not None else _NO_CHILDREN
+
+    def _writable_children(self) -> Dict[str, "StickyNote"]:
+        if self._children is None:
+            self._children = {}
+        return self._children
 
-    def add_child(self, title: str, description: str):
+    def _drop_child(self, title: str):
+        del self._children[title]
+        if not self._children:
+            self._children = None
+        self._invalidate()
+
+    def _invalidate(self):
+        """Drop the cached JSON of this note and its ancestors, up to the first one already dropped."""
+        note = self
+        while note is not None and note._fragment is not None:
+            note._fragment = None
+            note = note.parent
+
+    def add_child(self, title: str, description: str) -> "StickyNote":
         if title in self.children:
             raise ValueError("A sticky note with this title already exists at this level.")
-        self.children[title] = StickyNote(title, description)
-    
+        child = StickyNote(title, description, parent=self)
+        self._writable_children()[title] = child
+        self._invalidate()
+        return child
+
     def get_child(self, title: str) -> Optional["StickyNote"]:
         return self.children.get(title)
-        
+
     def to_dict(self):
         """Convert the sticky note to a dictionary format for JSON serialization"""
         children_list = []
@@ -21,35 +65,206 @@ class StickyNote:
             child_dict = child.to_dict()
             child_dict["id"] = title  # Use the title as the ID for simplicity
             children_list.append(child_dict)
-            
+
         return {
+            "noteId": self.id,
             "title": self.title,
             "description": self.description,
             "children": children_list
         }
 
+    def to_json(self) -> str:
+        """
+        The same structure as to_dict, as a JSON string.
+
+        Unchanged subtrees reuse their cached fragment, so after an edit only the path
+        from the edited note up to the root is serialized again.
+        """
+        if self._fragment is None:
+            children = ",".join(child.to_json() for child in self.children.values())
+            # Children carry their title as "id", see to_dict
+            id_field = "" if self.parent is None else f',"id":{json.dumps(self.title)}'
+            self._fragment = (
+                f'{{"noteId":{json.dumps(self.id)},"title":{json.dumps(self.title)},'
+                f'"description":{json.dumps(self.description)},"children":[{children}]{id_field}}}'
+            )
+        return self._fragment
+
     def __repr__(self):
         return f"StickyNote(title={self.title}, children={list(self.children.keys())})"
 
 class StickyNoteTree:
     def __init__(self):
-        self.root = StickyNote("Root", "Top-level container")
+        self.root = StickyNote("Root", "Top-level container", note_id="root")
+        # Every note by its stable ID, so ID-based operations skip the path walk
+        self._index: Dict[str, StickyNote] = {self.root.id: self.root}
+        # The sticky endpoints run on the threadpool. Writers hold this lock, and so does
+        # to_dict, so a reader never walks a children dict while a rename rekeys it
+        self._lock = threading.RLock()
+        # Bumped by every write. The epoch tells versions of different processes apart, so
+        # an ETag handed out before a restart never matches the new tree
+        self._epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+
+    @property
+    def version(self) -> str:
+        """Token that changes whenever the tree does, for ETags."""
+        return f"{self._epoch}-{self._version}"
 
-    def traverse_and_add(self, path: List[str], title: str, description: str):
+    def traverse_and_add(self, path: List[str], title: str, description: str) -> str:
+        with self._lock:
+            return self.add_note(self._resolve(path).id, title, description)
+
+    def _resolve(self, path: List[str]) -> StickyNote:
         current = self.root
         for level in path:
             if level in current.children:
                 current = current.children[level]
             else:
                 raise ValueError(f"Path '{level}' does not exist")
+        return current
+
+    def _note_at(self, path: List[str]) -> StickyNote:
+        parent = self._resolve(path[:-1])
+        if path[-1] not in parent.children:
+            raise ValueError(f"Note '{path[-1]}' not found")
+        return parent.children[path[-1]]
+
+    def get_note(self, note_id: str) -> StickyNote:
+        note = self._index.get(note_id)
+        if note is None:
+            raise StickyNoteNotFound(f"Note '{note_id}' not found")
+        return note
+
+    def note_info(self, note_id: str) -> Dict:
+        """A note's fields with its parent and child IDs, without the rest of its subtree."""
+        with self._lock:
+            note = self.get_note(note_id)
+            return {
+                "noteId": note.id,
+                "title": note.title,
+                "description": note.description,
+                "parentId": note.parent.id if note.parent else None,
+                "childIds": [child.id for child in note.children.values()]
+            }
+
+    def add_note(self, parent_id: str, title: str, description: str) -> str:
+        """Add a note under the note with parent_id and return the new note's ID."""
+        with self._lock:
+            child = self.get_note(parent_id).add_child(title, description)
+            self._index[child.id] = child
+            self._version += 1
+            return child.id
+
+    def edit_note(self, path: List[str], title: str, description: str):
+        """Update the title and description of the note at path."""
+        if not path:
+            raise ValueError("Invalid path: empty path provided")
 
-        current.add_child(title, description)
+        with self._lock:
+            self.edit_note_by_id(self._note_at(path).id, title, description)
+
+    def edit_note_by_id(self, note_id: str, title: str, description: str):
+        """Update the title and description of a note."""
+        with self._lock:
+            note = self.get_note(note_id)
+            old_title = note.title
+            note.title = title
+            note.description = description
+            note._invalidate()
+            self._version += 1
+
+            # If title changed, we need to update the key in the parent's children dict
+            if old_title != title and note.parent is not None:
+                siblings = note.parent.children
+                if title in siblings:
+                    # The sibling that had this title is replaced, as it always was
+                    self._unindex(siblings[title])
+                siblings[title] = note
+                del siblings[old_title]
+
+    def delete_note(self, path: List[str]):
+        """Delete the note at path and all its children."""
+        if not path:
+            raise ValueError("Cannot delete root note")
+
+        with self._lock:
+            self.delete_note_by_id(self._note_at(path).id)
+
+    def delete_note_by_id(self, note_id: str):
+        """Delete a note and all its children."""
+        with self._lock:
+            note = self.get_note(note_id)
+            if note.parent is None:
+                raise ValueError("Cannot delete root note")
+
+            note.parent._drop_child(note.title)
+            self._unindex(note)
+            self._version += 1
+
+    def move_note(self, path: List[str], new_parent_path: List[str]):
+        """Move the note at path, with all its children, under the note at new_parent_path."""
+        if not path:
+            raise ValueError("Cannot move root note")
+
+        with self._lock:
+            self.move_note_by_id(self._note_at(path).id, self._resolve(new_parent_path).id)
+
+    def move_note_by_id(self, note_id: str, new_parent_id: str):
+        """
+        Move a note, with all its children, under another note.
+
+        The subtree is relinked, not copied, so this costs O(depth) for the cycle
+        check and O(1) for the move itself; IDs and the index stay as they are.
+        """
+        with self._lock:
+            note = self.get_note(note_id)
+            new_parent = self.get_note(new_parent_id)
+            if note.parent is None:
+                raise ValueError("Cannot move root note")
+
+            ancestor = new_parent
+            while ancestor is not None:
+                if ancestor is note:
+                    raise ValueError("Cannot move a sticky note under itself or one of its children.")
+                ancestor = ancestor.parent
+
+            if new_parent is note.parent:
+                return
+            if note.title in new_parent.children:
+                raise ValueError("A sticky note with this title already exists at this level.")
+
+            note.parent._drop_child(note.title)
+            new_parent._writable_children()[note.title] = note
+            note.parent = new_parent
+            # The moved subtree's own fragment is still valid, only the new path is not
+            new_parent._invalidate()
+            self._version += 1
+
+    def _unindex(self, note: StickyNote):
+        """Drop a detached note and its descendants from the ID index."""
+        stack = [note]
+        while stack:
+            current = stack.pop()
+            self._index.pop(current.id, None)
+            stack.extend(current.children.values())
 
     def to_dict(self):
         """Convert the entire tree to a dictionary format for JSON serialization"""
-        return {
-            "root": self.root.to_dict()
-        }
-        
+        with self._lock:
+            return {
+                "root": self.root.to_dict()
+            }
+
+    def to_json(self) -> Tuple[str, str]:
+        """
+        The tree as to_dict() would encode it, with the version it was taken at.
+
+        Returns:
+            (version, JSON string)
+        """
+        with self._lock:
+            return self.version, f'{{"root":{self.root.to_json()}}}'
+
     def __repr__(self):
         return f"StickyNoteTree(root={self.root})"
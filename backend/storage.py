@@ -0,0 +1,805 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import StickyNoteNotFound
+
+# Knowledge base key holding the note ID high-water marks next to the checkpoints
+ID_COUNTERS_KEY = "idCounters"
+
+class KnowledgeBaseJournal:
+    """
+    Write-ahead journal for a HierarchicalDataManager knowledge base.
+
+    Every mutation is appended to `path` as one compact JSON line, so saving an
+    edit costs the size of the edit. compact() writes the whole knowledge base to
+    `<path>.snapshot` and empties the journal; replay() loads the snapshot and
+    re-applies the journal lines written after it.
+
+    Records carry a sequence number and the snapshot remembers the last one it
+    includes, so a crash between writing a snapshot and truncating the journal
+    cannot apply a record twice.
+    """
+
+    def __init__(self, path: str, compact_every: int = 1000, fsync: bool = False):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        # Small key/value state replayed alongside the knowledge base (current checkpoint, versions)
+        self.meta: Dict[str, Any] = {}
+        self._pending = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def needs_compaction(self) -> bool:
+        """Whether enough records piled up since the last snapshot to write a new one."""
+        return self._pending >= self.compact_every
+
+    def append(self, record: Dict[str, Any]):
+        """
+        Append one mutation record.
+
+        Args:
+            record: The record; "op" is "add", "update", "move", "remove", "checkpoint", "ids" or "meta"
+        """
+        with self._lock:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, **record}, separators=(",", ":"), default=str)
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending += 1
+
+    def set_meta(self, **fields):
+        """Update journal metadata and record the change."""
+        self.meta.update(fields)
+        self.append({"op": "meta", "fields": fields})
+
+    def compact(self, knowledge_base: Dict[str, Any]):
+        """
+        Write a snapshot of the knowledge base and start an empty journal.
+
+        The snapshot goes to a temporary file first and is moved into place
+        atomically, so a crash leaves either the old or the new snapshot.
+
+        Args:
+            knowledge_base: The full knowledge base as of the last appended record
+        """
+        with self._lock:
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"seq": self.seq, "meta": self.meta, "knowledgeBase": knowledge_base},
+                    f, separators=(",", ":"), default=str
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._pending = 0
+
+    def replay(self) -> Optional[Dict[str, Any]]:
+        """
+        Rebuild the knowledge base from the snapshot and the journal.
+
+        Returns:
+            The knowledge base, or None if neither file exists yet
+        """
+        knowledge_base = None
+        seq = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            knowledge_base = snapshot["knowledgeBase"]
+            seq = snapshot.get("seq", 0)
+            self.meta = snapshot.get("meta", {})
+
+        pending = 0
+        if os.path.exists(self.path):
+            replayer = _JournalReplayer(knowledge_base if knowledge_base is not None else {})
+            intact_bytes = 0
+            torn = False
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("missing newline")
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write; everything before it is intact
+                        torn = True
+                        break
+                    intact_bytes += len(line)
+                    if record.get("seq", 0) <= seq:
+                        continue
+                    if record["op"] == "meta":
+                        self.meta.update(record["fields"])
+                    else:
+                        replayer.apply(record)
+                    seq = record["seq"]
+                    pending += 1
+            if torn:
+                # Cut it off so new records are not appended to the broken line
+                print(f"Dropping incomplete journal record at the end of {self.path}")
+                with open(self.path, "r+b") as f:
+                    f.truncate(intact_bytes)
+            if knowledge_base is not None or pending:
+                knowledge_base = replayer.knowledge_base
+
+        self.seq = seq
+        self._pending = pending
+        return knowledge_base
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _JournalReplayer:
+    """Applies journal records to a plain knowledge base dict."""
+
+    def __init__(self, knowledge_base: Dict[str, Any]):
+        self.knowledge_base = knowledge_base
+        # checkpoint -> note ID -> (note, parent ID), built on first use
+        self._indexes: Dict[str, Dict[str, tuple]] = {}
+
+    def _index(self, checkpoint: str) -> Dict[str, tuple]:
+        index = self._indexes.get(checkpoint)
+        if index is None:
+            index = {}
+            for parent_id, notes in self.knowledge_base.get(checkpoint, {}).items():
+                for note in notes:
+                    index.setdefault(note["id"], (note, parent_id))
+            self._indexes[checkpoint] = index
+        return index
+
+    def apply(self, record: Dict[str, Any]):
+        op = record["op"]
+        checkpoint = record.get("checkpoint")
+
+        if op == "ids":
+            self.knowledge_base.setdefault(ID_COUNTERS_KEY, {})[record["prefix"]] = record["value"]
+            return
+        if op == "checkpoint":
+            # Replayed checkpoints are independent copies; sharing is only an in-memory saving
+            self.knowledge_base[checkpoint] = copy.deepcopy(self.knowledge_base.get(record["from"], {"root": []}))
+            self._indexes.pop(checkpoint, None)
+            return
+
+        data = self.knowledge_base.setdefault(checkpoint, {"root": []})
+        index = self._index(checkpoint)
+
+        if op == "add":
+            note = record["note"]
+            data.setdefault(record["parentId"], []).append(note)
+            index.setdefault(note["id"], (note, record["parentId"]))
+        elif op == "update":
+            entry = index.get(record["id"])
+            if entry:
+                entry[0].update(record["fields"])
+        elif op == "move":
+            entry = index.get(record["id"])
+            if entry:
+                note, parent_id = entry
+                data[parent_id] = [sibling for sibling in data.get(parent_id, []) if sibling is not note]
+                data.setdefault(record["parentId"], []).append(note)
+                note["parentId"] = None if record["parentId"] == "root" else record["parentId"]
+                index[record["id"]] = (note, record["parentId"])
+        elif op == "remove":
+            entry = index.get(record["id"])
+            parent_id = record.get("parentId")
+            if parent_id is not None and (entry is None or entry[1] != parent_id):
+                # A copy of a duplicated ID other than the indexed one
+                note = next((sibling for sibling in data.get(parent_id, []) if sibling["id"] == record["id"]), None)
+                entry = (note, parent_id) if note is not None else None
+            if entry:
+                note, parent_id = entry
+                if index.get(record["id"], (None,))[0] is note:
+                    del index[record["id"]]
+                siblings = data.get(parent_id, [])
+                data[parent_id] = [sibling for sibling in siblings if sibling is not note]
+                data.pop(note["id"], None)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database for sharing between threads and worker processes.
+
+    WAL mode lets readers in other workers proceed while one worker writes, and
+    the busy timeout makes concurrent writers wait instead of failing.
+    """
+    db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    return db
+
+
+class SqliteStickyNoteTree:
+    """
+    StickyNoteTree stored in SQLite, so the tree survives restarts and every
+    worker sees the same notes.
+
+    Note IDs are the row IDs as strings ('root' for the root). ID-based
+    operations are primary key lookups; each step of a title path is one lookup
+    on the (parent_id, title) index.
+
+    Every write bumps a version row in the same transaction, so all workers agree
+    on it; to_json() rebuilds the tree only when the version has moved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = connect_sqlite(path)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sticky_notes ("
+                "id INTEGER PRIMARY KEY, parent_id INTEGER, title TEXT NOT NULL, "
+                "description TEXT NOT NULL, position INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS sticky_notes_parent_title ON sticky_notes (parent_id, title)"
+            )
+            if self._db.execute("SELECT 1 FROM sticky_notes WHERE parent_id IS NULL").fetchone() is None:
+                self._db.execute(
+                    "INSERT INTO sticky_notes (parent_id, title, description, position) VALUES (NULL, ?, ?, 0)",
+                    ("Root", "Top-level container")
+                )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sticky_tree_version ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), epoch TEXT NOT NULL, version INTEGER NOT NULL)"
+            )
+            # The epoch keeps a recreated database from reusing version numbers of the old one
+            self._db.execute(
+                "INSERT OR IGNORE INTO sticky_tree_version (id, epoch, version) VALUES (0, ?, 0)",
+                (uuid.uuid4().hex[:8],)
+            )
+        # (version, JSON) of the last to_json() call
+        self._json_cache: Optional[Tuple[str, str]] = None
+
+    def _bump_version(self):
+        self._db.execute("UPDATE sticky_tree_version SET version = version + 1 WHERE id = 0")
+
+    def _read_version(self) -> str:
+        epoch, version = self._db.execute("SELECT epoch, version FROM sticky_tree_version WHERE id = 0").fetchone()
+        return f"{epoch}-{version}"
+
+    @property
+    def version(self) -> str:
+        """Token that changes whenever the tree does, in this or any other worker, for ETags."""
+        with self._lock:
+            return self._read_version()
+
+    def _root_id(self) -> int:
+        return self._db.execute("SELECT id FROM sticky_notes WHERE parent_id IS NULL").fetchone()[0]
+
+    def _child_id(self, parent_id: int, title: str) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT id FROM sticky_notes WHERE parent_id = ? AND title = ?", (parent_id, title)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _resolve(self, path: List[str]) -> int:
+        current = self._root_id()
+        for level in path:
+            current = self._child_id(current, level)
+            if current is None:
+                raise ValueError(f"Path '{level}' does not exist")
+        return current
+
+    def _next_position(self, parent_id: int) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM sticky_notes WHERE parent_id = ?", (parent_id,)
+        ).fetchone()[0]
+
+    def _row_id(self, note_id: str) -> int:
+        """Row ID for a public note ID ('root' or the row ID as a string)."""
+        if note_id == "root":
+            return self._root_id()
+        row = None
+        if str(note_id).isdigit():
+            row = self._db.execute("SELECT id FROM sticky_notes WHERE id = ?", (int(note_id),)).fetchone()
+        if row is None:
+            raise StickyNoteNotFound(f"Note '{note_id}' not found")
+        return row[0]
+
+    def _public_id(self, row_id: int, parent_id: Optional[int]) -> str:
+        return "root" if parent_id is None else str(row_id)
+
+    def _note_at(self, path: List[str]) -> int:
+        parent_id = self._resolve(path[:-1])
+        note_id = self._child_id(parent_id, path[-1])
+        if note_id is None:
+            raise ValueError(f"Note '{path[-1]}' not found")
+        return note_id
+
+    def traverse_and_add(self, path: List[str], title: str, description: str) -> str:
+        with self._lock, self._db:
+            return self._add(self._resolve(path), title, description)
+
+    def add_note(self, parent_id: str, title: str, description: str) -> str:
+        """Add a note under the note with parent_id and return the new note's ID."""
+        with self._lock, self._db:
+            return self._add(self._row_id(parent_id), title, description)
+
+    def _add(self, parent_id: int, title: str, description: str) -> str:
+        try:
+            cursor = self._db.execute(
+                "INSERT INTO sticky_notes (parent_id, title, description, position) VALUES (?, ?, ?, ?)",
+                (parent_id, title, description, self._next_position(parent_id))
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError("A sticky note with this title already exists at this level.")
+        self._bump_version()
+        return str(cursor.lastrowid)
+
+    def note_info(self, note_id: str) -> Dict[str, Any]:
+        """A note's fields with its parent and child IDs, without the rest of its subtree."""
+        with self._lock:
+            row_id = self._row_id(note_id)
+            _, parent_id, title, description = self._db.execute(
+                "SELECT id, parent_id, title, description FROM sticky_notes WHERE id = ?", (row_id,)
+            ).fetchone()
+            child_ids = [
+                str(child_id) for (child_id,) in self._db.execute(
+                    "SELECT id FROM sticky_notes WHERE parent_id = ? ORDER BY position", (row_id,)
+                )
+            ]
+            parent_public_id = None
+            if parent_id is not None:
+                grandparent = self._db.execute("SELECT parent_id FROM sticky_notes WHERE id = ?", (parent_id,)).fetchone()
+                parent_public_id = self._public_id(parent_id, grandparent[0])
+        return {
+            "noteId": self._public_id(row_id, parent_id),
+            "title": title,
+            "description": description,
+            "parentId": parent_public_id,
+            "childIds": child_ids
+        }
+
+    def edit_note(self, path: List[str], title: str, description: str):
+        """Update the title and description of the note at path."""
+        if not path:
+            raise ValueError("Invalid path: empty path provided")
+
+        with self._lock, self._db:
+            self._edit(self._note_at(path), title, description)
+
+    def edit_note_by_id(self, note_id: str, title: str, description: str):
+        """Update the title and description of a note."""
+        with self._lock, self._db:
+            self._edit(self._row_id(note_id), title, description)
+
+    def _edit(self, note_id: int, title: str, description: str):
+        parent_id, old_title = self._db.execute(
+            "SELECT parent_id, title FROM sticky_notes WHERE id = ?", (note_id,)
+        ).fetchone()
+        self._bump_version()
+        if title == old_title or parent_id is None:
+            self._db.execute(
+                "UPDATE sticky_notes SET title = ?, description = ? WHERE id = ?", (title, description, note_id)
+            )
+            return
+
+        # Like the in-memory tree: a renamed note replaces a sibling with its new title (taking
+        # its place), otherwise it moves to the end
+        replaced = self._db.execute(
+            "SELECT id, position FROM sticky_notes WHERE parent_id = ? AND title = ?", (parent_id, title)
+        ).fetchone()
+        if replaced:
+            self._delete_subtree(replaced[0])
+        position = replaced[1] if replaced else self._next_position(parent_id)
+        self._db.execute(
+            "UPDATE sticky_notes SET title = ?, description = ?, position = ? WHERE id = ?",
+            (title, description, position, note_id)
+        )
+
+    def delete_note(self, path: List[str]):
+        """Delete the note at path and all its children."""
+        if not path:
+            raise ValueError("Cannot delete root note")
+
+        with self._lock, self._db:
+            self._delete_subtree(self._note_at(path))
+
+    def delete_note_by_id(self, note_id: str):
+        """Delete a note and all its children."""
+        with self._lock, self._db:
+            row_id = self._row_id(note_id)
+            if row_id == self._root_id():
+                raise ValueError("Cannot delete root note")
+            self._delete_subtree(row_id)
+
+    def move_note(self, path: List[str], new_parent_path: List[str]):
+        """Move the note at path, with all its children, under the note at new_parent_path."""
+        if not path:
+            raise ValueError("Cannot move root note")
+
+        with self._lock, self._db:
+            self._move(self._note_at(path), self._resolve(new_parent_path))
+
+    def move_note_by_id(self, note_id: str, new_parent_id: str):
+        """Move a note, with all its children, under another note."""
+        with self._lock, self._db:
+            self._move(self._row_id(note_id), self._row_id(new_parent_id))
+
+    def _move(self, note_id: int, new_parent_id: int):
+        if note_id == self._root_id():
+            raise ValueError("Cannot move root note")
+
+        # Walk up from the new parent; finding the note there would make a cycle
+        is_cycle = self._db.execute(
+            "WITH RECURSIVE ancestors(id) AS ("
+            "SELECT ? UNION ALL SELECT n.parent_id FROM sticky_notes n JOIN ancestors a ON n.id = a.id "
+            "WHERE n.parent_id IS NOT NULL) "
+            "SELECT 1 FROM ancestors WHERE id = ?",
+            (new_parent_id, note_id)
+        ).fetchone()
+        if is_cycle:
+            raise ValueError("Cannot move a sticky note under itself or one of its children.")
+
+        parent_id = self._db.execute("SELECT parent_id FROM sticky_notes WHERE id = ?", (note_id,)).fetchone()[0]
+        if parent_id == new_parent_id:
+            return
+        try:
+            self._db.execute(
+                "UPDATE sticky_notes SET parent_id = ?, position = ? WHERE id = ?",
+                (new_parent_id, self._next_position(new_parent_id), note_id)
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError("A sticky note with this title already exists at this level.")
+        self._bump_version()
+
+    def _delete_subtree(self, note_id: Optional[int]):
+        if note_id is None:
+            return
+        self._bump_version()
+        self._db.execute(
+            "WITH RECURSIVE subtree(id) AS ("
+            "SELECT ? UNION ALL SELECT n.id FROM sticky_notes n JOIN subtree s ON n.parent_id = s.id) "
+            "DELETE FROM sticky_notes WHERE id IN (SELECT id FROM subtree)",
+            (note_id,)
+        )
+
+    def _rows(self) -> List[Tuple[int, Optional[int], str, str]]:
+        return self._db.execute(
+            "SELECT id, parent_id, title, description FROM sticky_notes ORDER BY parent_id, position"
+        ).fetchall()
+
+    def to_dict(self):
+        """Convert the entire tree to a dictionary format for JSON serialization"""
+        with self._lock:
+            rows = self._rows()
+        return self._build(rows)
+
+    def to_json(self) -> Tuple[str, str]:
+        """
+        The tree as to_dict() would encode it, with the version it was taken at.
+
+        Rows are only read again when the version has moved since the last call.
+
+        Returns:
+            (version, JSON string)
+        """
+        with self._lock:
+            # One read transaction, so the version and the rows come from the same snapshot
+            self._db.execute("BEGIN")
+            try:
+                version = self._read_version()
+                cached = self._json_cache
+                if cached is not None and cached[0] == version:
+                    return cached
+                rows = self._rows()
+            finally:
+                self._db.commit()
+
+        tree_json = json.dumps(self._build(rows), separators=(",", ":"))
+        self._json_cache = (version, tree_json)
+        return version, tree_json
+
+    def _build(self, rows: List[Tuple[int, Optional[int], str, str]]) -> Dict[str, Any]:
+        nodes = {}
+        children: Dict[Optional[int], List[int]] = {}
+        for note_id, parent_id, title, description in rows:
+            nodes[note_id] = (self._public_id(note_id, parent_id), title, description)
+            children.setdefault(parent_id, []).append(note_id)
+
+        def build(note_id: int) -> Dict[str, Any]:
+            public_id, title, description = nodes[note_id]
+            child_dicts = []
+            for child_id in children.get(note_id, []):
+                child_dict = build(child_id)
+                child_dict["id"] = nodes[child_id][1]
+                child_dicts.append(child_dict)
+            return {"noteId": public_id, "title": title, "description": description, "children": child_dicts}
+
+        return {"root": build(children[None][0])}
+
+    def __repr__(self):
+        return f"SqliteStickyNoteTree(path={self.path})"
+
+
+class SqliteCanvasStore:
+    """
+    Canvas knowledge bases stored in SQLite and shared by every worker.
+
+    One row per note occurrence, keyed by (canvas, checkpoint, parent, position)
+    so child lists load in order and a note ID that appears twice keeps both rows;
+    a second index on note ID serves patches. Patches name notes by ID, so like the
+    manager's ID index they act on the first occurrence in load order, except
+    removals, which name the parent the note was removed from. Child lists, empty
+    ones included, have their own rows with a sequence number, so a load rebuilds
+    checkpoints and lists in the order they were created, as the in-memory dicts
+    keep them. A canvas carries a version; writers apply a patch only if the version
+    is still the one they loaded, so two workers cannot overwrite each other.
+    """
+
+    def __init__(self, path: str):
+        self._db = connect_sqlite(path)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS canvases ("
+                "canvas_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                "current_checkpoint TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "id_counters TEXT NOT NULL DEFAULT '{}')"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(canvases)")]
+            if "id_counters" not in columns:
+                self._db.execute("ALTER TABLE canvases ADD COLUMN id_counters TEXT NOT NULL DEFAULT '{}'")
+            notes_table = (
+                "canvas_notes ("
+                "canvas_id TEXT NOT NULL, checkpoint TEXT NOT NULL, id TEXT NOT NULL, "
+                "parent_id TEXT NOT NULL, position INTEGER NOT NULL, "
+                "data TEXT NOT NULL, PRIMARY KEY (canvas_id, checkpoint, parent_id, position))"
+            )
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {notes_table}")
+            columns = {row[1]: row[5] for row in self._db.execute("PRAGMA table_info(canvas_notes)")}
+            if "title_lower" in columns or columns["id"]:
+                # Earlier layouts keyed rows by note ID, or had a title column nothing reads;
+                # their indexes go with the old table
+                self._db.execute("ALTER TABLE canvas_notes RENAME TO canvas_notes_old")
+                self._db.execute(f"CREATE TABLE {notes_table}")
+                self._db.execute(
+                    "INSERT INTO canvas_notes SELECT canvas_id, checkpoint, id, parent_id, position, data "
+                    "FROM canvas_notes_old"
+                )
+                self._db.execute("DROP TABLE canvas_notes_old")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS canvas_notes_id ON canvas_notes (canvas_id, checkpoint, id)"
+            )
+            has_lists = self._db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'canvas_lists'"
+            ).fetchone()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS canvas_lists ("
+                "canvas_id TEXT NOT NULL, checkpoint TEXT NOT NULL, parent_id TEXT NOT NULL, "
+                "seq INTEGER NOT NULL, PRIMARY KEY (canvas_id, checkpoint, parent_id))"
+            )
+            if not has_lists:
+                # Canvases stored before lists had rows: row order is the closest thing to creation order
+                self._db.execute(
+                    "INSERT INTO canvas_lists SELECT canvas_id, checkpoint, parent_id, MIN(rowid) "
+                    "FROM canvas_notes GROUP BY canvas_id, checkpoint, parent_id"
+                )
+
+    def create(self, canvas_id: str, knowledge_base: Dict[str, Any], current_checkpoint: str):
+        """Store a new canvas at version 0."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO canvases (canvas_id, version, current_checkpoint, updated_at, id_counters) "
+                "VALUES (?, 0, ?, ?, ?)",
+                (canvas_id, current_checkpoint, time.time(), json.dumps(knowledge_base.get(ID_COUNTERS_KEY, {})))
+            )
+            self._db.executemany(
+                "INSERT INTO canvas_notes VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (canvas_id, checkpoint, note["id"], parent_id, position, json.dumps(note, default=str))
+                    for checkpoint, data in knowledge_base.items() if checkpoint != ID_COUNTERS_KEY
+                    for parent_id, notes in data.items()
+                    for position, note in enumerate(notes)
+                ]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO canvas_lists VALUES (?, ?, ?, ?)",
+                [
+                    (canvas_id, checkpoint, parent_id, seq)
+                    for seq, (checkpoint, parent_id) in enumerate(
+                        (checkpoint, parent_id)
+                        for checkpoint, data in knowledge_base.items() if checkpoint != ID_COUNTERS_KEY
+                        for parent_id in data
+                    )
+                ]
+            )
+
+    def _ensure_list(self, canvas_id: str, checkpoint: str, parent_id: str):
+        """Give a child list a row after every existing one, as a new dict key goes last."""
+        self._db.execute(
+            "INSERT OR IGNORE INTO canvas_lists SELECT ?, ?, ?, COALESCE(MAX(seq) + 1, 0) "
+            "FROM canvas_lists WHERE canvas_id = ?",
+            (canvas_id, checkpoint, parent_id, canvas_id)
+        )
+
+    def _find_note_row(self, canvas_id: str, checkpoint: str, note_id: str,
+                       parent_id: str = None) -> Optional[Tuple[int, str, str]]:
+        """
+        Find the first occurrence of a note ID in load order, optionally within one parent's list.
+
+        Returns:
+            (rowid, parent ID, data), or None if there is no such note
+        """
+        query = (
+            "SELECT n.rowid, n.parent_id, n.data FROM canvas_notes n JOIN canvas_lists l "
+            "ON l.canvas_id = n.canvas_id AND l.checkpoint = n.checkpoint AND l.parent_id = n.parent_id "
+            "WHERE n.canvas_id = ? AND n.checkpoint = ? AND n.id = ?"
+        )
+        params: Tuple = (canvas_id, checkpoint, note_id)
+        if parent_id is not None:
+            query += " AND n.parent_id = ?"
+            params += (parent_id,)
+        return self._db.execute(query + " ORDER BY l.seq, n.position LIMIT 1", params).fetchone()
+
+    def version(self, canvas_id: str) -> Optional[int]:
+        """Current version of a canvas, or None if it does not exist."""
+        with self._lock:
+            row = self._db.execute("SELECT version FROM canvases WHERE canvas_id = ?", (canvas_id,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, canvas_id: str) -> Optional[Tuple[Dict[str, Any], int, str]]:
+        """
+        Load a whole canvas.
+
+        Returns:
+            (knowledge base, version, current checkpoint), or None if the canvas does not exist
+        """
+        with self._lock:
+            # One read transaction, so the lists and notes come from the same commit
+            self._db.execute("BEGIN")
+            try:
+                canvas = self._db.execute(
+                    "SELECT version, current_checkpoint, id_counters FROM canvases WHERE canvas_id = ?", (canvas_id,)
+                ).fetchone()
+                if canvas is None:
+                    return None
+                lists = self._db.execute(
+                    "SELECT checkpoint, parent_id FROM canvas_lists WHERE canvas_id = ? ORDER BY seq", (canvas_id,)
+                ).fetchall()
+                rows = self._db.execute(
+                    "SELECT checkpoint, parent_id, data FROM canvas_notes WHERE canvas_id = ? "
+                    "ORDER BY checkpoint, parent_id, position",
+                    (canvas_id,)
+                ).fetchall()
+            finally:
+                self._db.commit()
+
+        knowledge_base: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        for checkpoint, parent_id in lists:
+            knowledge_base.setdefault(checkpoint, {})[parent_id] = []
+        for checkpoint, parent_id, data in rows:
+            knowledge_base.setdefault(checkpoint, {}).setdefault(parent_id, []).append(json.loads(data))
+        knowledge_base.setdefault(canvas[1], {})
+        knowledge_base[ID_COUNTERS_KEY] = json.loads(canvas[2])
+        return knowledge_base, canvas[0], canvas[1]
+
+    def apply_patch(self, canvas_id: str, patch: Dict[str, Any], base_version: int, new_version: int) -> bool:
+        """
+        Write a HierarchicalDataManager.take_changes() patch.
+
+        Args:
+            canvas_id: The canvas
+            patch: The patch to apply
+            base_version: Version the patch was made against
+            new_version: Version the canvas has after the patch
+
+        Returns:
+            False, without writing anything, if another writer moved the canvas past base_version
+        """
+        with self._lock, self._db:
+            updated = self._db.execute(
+                "UPDATE canvases SET version = ?, updated_at = ? WHERE canvas_id = ? AND version = ?",
+                (new_version, time.time(), canvas_id, base_version)
+            )
+            if updated.rowcount == 0:
+                return False
+
+            if patch.get("currentCheckpoint"):
+                self._db.execute(
+                    "UPDATE canvases SET current_checkpoint = ? WHERE canvas_id = ?",
+                    (patch["currentCheckpoint"], canvas_id)
+                )
+
+            if patch.get("idCounters"):
+                counters = json.loads(self._db.execute(
+                    "SELECT id_counters FROM canvases WHERE canvas_id = ?", (canvas_id,)
+                ).fetchone()[0])
+                counters.update(patch["idCounters"])
+                self._db.execute(
+                    "UPDATE canvases SET id_counters = ? WHERE canvas_id = ?", (json.dumps(counters), canvas_id)
+                )
+
+            for entry in patch.get("checkpoints", []):
+                for table in ("canvas_notes", "canvas_lists"):
+                    self._db.execute(
+                        f"DELETE FROM {table} WHERE canvas_id = ? AND checkpoint = ?", (canvas_id, entry["checkpoint"])
+                    )
+                self._db.execute(
+                    "INSERT INTO canvas_notes "
+                    "SELECT canvas_id, ?, id, parent_id, position, data FROM canvas_notes "
+                    "WHERE canvas_id = ? AND checkpoint = ?",
+                    (entry["checkpoint"], canvas_id, entry["from"])
+                )
+                # The copy's lists go after every existing one, in the source's order
+                offset = self._db.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM canvas_lists WHERE canvas_id = ?", (canvas_id,)
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO canvas_lists SELECT canvas_id, ?, parent_id, seq + ? "
+                    "FROM canvas_lists WHERE canvas_id = ? AND checkpoint = ?",
+                    (entry["checkpoint"], offset, canvas_id, entry["from"])
+                )
+            for entry in patch.get("added", []):
+                note = entry["note"]
+                self._ensure_list(canvas_id, entry["checkpoint"], entry["parentId"])
+                position = self._db.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM canvas_notes "
+                    "WHERE canvas_id = ? AND checkpoint = ? AND parent_id = ?",
+                    (canvas_id, entry["checkpoint"], entry["parentId"])
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO canvas_notes VALUES (?, ?, ?, ?, ?, ?)",
+                    (canvas_id, entry["checkpoint"], note["id"], entry["parentId"],
+                     position, json.dumps(note, default=str))
+                )
+            for entry in patch.get("updated", []):
+                row = self._find_note_row(canvas_id, entry["checkpoint"], entry["id"])
+                if row is None:
+                    continue
+                note = {**json.loads(row[2]), **entry["fields"]}
+                self._db.execute(
+                    "UPDATE canvas_notes SET data = ? WHERE rowid = ?", (json.dumps(note, default=str), row[0])
+                )
+            for entry in patch.get("moved", []):
+                row = self._find_note_row(canvas_id, entry["checkpoint"], entry["id"])
+                if row is None:
+                    continue
+                self._ensure_list(canvas_id, entry["checkpoint"], entry["parentId"])
+                position = self._db.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM canvas_notes "
+                    "WHERE canvas_id = ? AND checkpoint = ? AND parent_id = ?",
+                    (canvas_id, entry["checkpoint"], entry["parentId"])
+                ).fetchone()[0]
+                note = {**json.loads(row[2]), "parentId": None if entry["parentId"] == "root" else entry["parentId"]}
+                # Descendants keep their rows: their parent_id is the moved note's ID, which did not change
+                self._db.execute(
+                    "UPDATE canvas_notes SET parent_id = ?, position = ?, data = ? WHERE rowid = ?",
+                    (entry["parentId"], position, json.dumps(note, default=str), row[0])
+                )
+            # Subtree removals list every descendant, so deleting the rows themselves is enough.
+            # A removed note's child list goes with it; its parent's list stays, even if now empty
+            for entry in patch.get("removed", []):
+                row = self._find_note_row(canvas_id, entry["checkpoint"], entry["id"], entry.get("parentId"))
+                if row is not None:
+                    self._db.execute("DELETE FROM canvas_notes WHERE rowid = ?", (row[0],))
+                self._db.execute(
+                    "DELETE FROM canvas_lists WHERE canvas_id = ? AND checkpoint = ? AND parent_id = ?",
+                    (canvas_id, entry["checkpoint"], entry["id"])
+                )
+            return True